@@ -0,0 +1,68 @@
+import pytest
+
+from webtodotxt.main import _decode_cursor, _select_page, _sort_by_done
+from webtodotxt.models.file import DbFile
+from webtodotxt.models.todos import Todos
+
+
+@pytest.fixture
+def tasks(tmp_path):
+    path = tmp_path / "todo.txt"
+    path.write_text(
+        "\n".join(
+            [
+                "(B) 2026-01-02 b1",
+                "no priority",
+                "(A) a1",
+                "x 2026-03-01 2026-01-01 done1",
+                "(B) 2026-01-02 b2",
+                "x done without date",
+                "(A) 2026-02-01 a2",
+                "x 2026-03-01 2026-01-01 done2",
+                "2026-01-05 dated",
+                "x 2026-04-01 done3",
+            ]
+        )
+        + "\n"
+    )
+    return Todos(DbFile(str(path))).get_tasks()
+
+
+@pytest.mark.parametrize("state", ["done", "undone"])
+@pytest.mark.parametrize("limit", [1, 2, 3])
+def test_pages_cover_every_task_once(tasks, state, limit):
+    done, undone = _sort_by_done(tasks)
+    selected = done if state == "done" else undone
+    expected, _ = _select_page(selected, state, -1)
+
+    pages = []
+    cursor = None
+    while True:
+        page, cursor = _select_page(
+            selected, state, limit, after=_decode_cursor(cursor, state)
+        )
+        pages.extend(page)
+        if cursor is None:
+            break
+
+    assert pages == expected
+
+
+@pytest.mark.parametrize(
+    "raw, state",
+    [
+        ("5:3", "undone"),
+        ("A:1:2", "done"),
+        ("x:1", "done"),
+        ("A:-inf:x", "undone"),
+        ("1", "done"),
+    ],
+)
+def test_invalid_cursor(raw, state):
+    with pytest.raises(ValueError):
+        _decode_cursor(raw, state)
+
+
+def test_missing_cursor():
+    assert _decode_cursor(None, "done") is None
+    assert _decode_cursor("", "undone") is None
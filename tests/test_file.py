@@ -0,0 +1,164 @@
+import pytest
+from pytodotxt import Task
+
+from webtodotxt.models.file import DbFile, detect_linesep
+from webtodotxt.models.todos import Todos
+
+
+@pytest.fixture
+def path(tmp_path):
+    return tmp_path / "todo.txt"
+
+
+@pytest.mark.parametrize(
+    "data, expected",
+    [(b"a\nb\r\n", "\n"), (b"a\r\nb\n", "\r\n"), (b"a\rb", "\r"), (b"a", "?")],
+)
+def test_detect_linesep(data, expected):
+    assert detect_linesep(data, "?") == expected
+
+
+def test_append_lines_returns_offsets(path):
+    path.write_bytes(b"one\n")
+
+    offsets = DbFile(str(path)).append_lines(["two", "three"])
+
+    data = path.read_bytes()
+    assert data == b"one\ntwo\nthree\n"
+    assert [data[offset : offset + 3] for offset in offsets] == [b"two", b"thr"]
+
+
+def test_append_uses_the_file_linesep(path):
+    path.write_bytes(b"one\r\ntwo")
+
+    DbFile(str(path)).append_line("three")
+
+    assert path.read_bytes() == b"one\r\ntwo\r\nthree\r\n"
+
+
+def test_append_to_empty_file_uses_given_linesep(path):
+    path.write_bytes(b"")
+
+    DbFile(str(path)).append_line("one", "\r\n")
+
+    assert path.read_bytes() == b"one\r\n"
+
+
+def test_api_and_form_appends_stay_separate_tasks(path):
+    path.write_bytes(b"one\r\n")
+    db_file = DbFile(str(path))
+    todos = Todos(db_file)
+
+    db_file.append_line("api task")
+    todos.append_and_save(Task("form task"))
+
+    lines = [task.get_line() for task in Todos(db_file).get_tasks()]
+    assert lines == ["one", "api task", "form task"]
+    assert [task.get_line() for task in todos.get_tasks()] == lines
+
+
+@pytest.mark.parametrize("line", ["a\nb", "a\r\nb", "a\rb"])
+def test_multi_line_tasks_are_rejected(path, line):
+    path.write_bytes(b"one\n")
+    todos = Todos(DbFile(str(path)))
+
+    with pytest.raises(ValueError):
+        todos.append_and_save(Task(line))
+    with pytest.raises(ValueError):
+        todos.get_task(0).parse(line)
+
+    assert path.read_bytes() == b"one\n"
+    assert [task.get_line() for task in todos.get_tasks()] == ["one"]
+
+
+@pytest.mark.parametrize(
+    "new, expected",
+    [
+        (b"TWO", b"one\nTWO\nthree\n"),
+        (b"2", b"one\n2\nthree\n"),
+        (b"twelve", b"one\ntwelve\nthree\n"),
+    ],
+)
+def test_replace_range(path, new, expected):
+    path.write_bytes(b"one\ntwo\nthree\n")
+
+    assert DbFile(str(path)).replace_range(4, b"two", new)
+    assert path.read_bytes() == expected
+
+
+def test_replace_range_checks_old_data(path):
+    path.write_bytes(b"one\ntwo\n")
+
+    assert not DbFile(str(path)).replace_range(4, b"six", b"ten")
+    assert path.read_bytes() == b"one\ntwo\n"
+
+
+def test_save_task_patches_its_line_only(path):
+    path.write_bytes(b"(A)  keep   spacing\ntoggle me\nlast\n")
+    todos = Todos(DbFile(str(path)))
+
+    todos.get_task(1).parse("(B) toggled line")
+    todos.save_task(1)
+    todos.get_task(2).parse("last edited")
+    todos.save_task(2)
+
+    assert path.read_bytes() == b"(A)  keep   spacing\n(B) toggled line\nlast edited\n"
+
+
+def test_save_task_after_external_change(path):
+    path.write_bytes(b"one\ntwo\n")
+    todos = Todos(DbFile(str(path)))
+    with open(path, "ab") as file:
+        file.write(b"three\n")
+
+    todos.get_task(0).parse("ONE")
+    todos.save_task(0)
+
+    assert path.read_bytes() == b"ONE\ntwo\nthree\n"
+
+
+def test_save_task_fails_if_its_line_moved(path):
+    path.write_bytes(b"one\ntwo\n")
+    todos = Todos(DbFile(str(path)))
+    path.write_bytes(b"zero\none\ntwo\n")
+
+    todos.get_task(0).parse("ONE")
+    with pytest.raises(RuntimeError):
+        todos.save_task(0)
+
+    assert path.read_bytes() == b"zero\none\ntwo\n"
+
+
+def test_atomic_write_replaces_the_file(path):
+    path.write_bytes(b"old\n")
+    path.chmod(0o600)
+
+    DbFile(str(path)).atomic_write(b"new\n")
+
+    assert path.read_bytes() == b"new\n"
+    assert path.stat().st_mode & 0o777 == 0o600
+    assert sorted(p.name for p in path.parent.iterdir()) == ["todo.txt"]
+
+
+def test_failed_atomic_write_keeps_the_file(path):
+    path.write_bytes(b"old\n")
+
+    with pytest.raises(OSError):
+        with DbFile(str(path)).atomic_writer() as file:
+            file.write(b"partial")
+            raise OSError("disk full")
+
+    assert path.read_bytes() == b"old\n"
+    assert sorted(p.name for p in path.parent.iterdir()) == ["todo.txt"]
+
+
+def test_save_keeps_unchanged_lines_as_read(path):
+    path.write_bytes(b"x 2026-03-01 alpha\n(A)  keep   spacing\nfoo\nbar\n")
+    todos = Todos(DbFile(str(path)))
+
+    todos.delete_task(2)
+    with todos.batch():
+        todos.get_task(2).parse("(B) bar")
+        todos.append_task(Task("baz"))
+
+    assert path.read_bytes() == b"x 2026-03-01 alpha\n(A)  keep   spacing\n(B) bar\nbaz\n"
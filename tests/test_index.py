@@ -0,0 +1,77 @@
+import random
+
+from webtodotxt.models.file import DbFile
+from webtodotxt.models.todos import Todos
+
+
+WORDS = ["alpha", "beta", "gamma", "delta", "+home", "+work", "@phone", "@pc"]
+
+
+def _random_line(rng: random.Random) -> str:
+    parts = []
+    if rng.random() < 0.3:
+        parts.append(f"({rng.choice('ABC')})")
+    if rng.random() < 0.3:
+        parts.append(f"2026-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}")
+    parts.extend(rng.choice(WORDS) for _ in range(rng.randint(1, 4)))
+    if rng.random() < 0.3:
+        parts.append(f"due:2026-1{rng.randint(0, 2)}-0{rng.randint(1, 9)}")
+    line = " ".join(parts)
+    return f"x {line}" if rng.random() < 0.2 else line
+
+
+def _edit(rng: random.Random, lines: list[str]) -> None:
+    for _ in range(rng.choice([1, 2, 5, 300])):
+        action = rng.random()
+        if action < 0.3 or not lines:
+            lines.append(_random_line(rng))
+        elif action < 0.5:
+            lines.insert(rng.randrange(len(lines)), _random_line(rng))
+        elif action < 0.75:
+            del lines[rng.randrange(len(lines))]
+        else:
+            lines[rng.randrange(len(lines))] = _random_line(rng)
+
+
+def _state(todos: Todos):
+    return (
+        [(index._index, index._keys) for index in todos._indexes],
+        todos._search._vocabulary,
+        todos._fields._dates,
+    )
+
+
+def test_reload_matches_fresh_parse(tmp_path):
+    path = tmp_path / "todo.txt"
+    rng = random.Random(8)
+    lines = [_random_line(rng) for _ in range(50)]
+    path.write_text("\n".join(lines) + "\n")
+    todos = Todos(DbFile(str(path)))
+
+    for _ in range(60):
+        _edit(rng, lines)
+        path.write_text("\n".join(lines) + "\n")
+        todos.reload()
+
+        assert _state(todos) == _state(Todos(DbFile(str(path))))
+
+
+def test_delete_matches_fresh_parse(tmp_path):
+    path = tmp_path / "todo.txt"
+    rng = random.Random(9)
+    path.write_text("".join(_random_line(rng) + "\n" for _ in range(80)))
+    todos = Todos(DbFile(str(path)))
+
+    for _ in range(20):
+        todos.delete_task(rng.randrange(len(todos.get_tasks())))
+
+        assert _state(todos) == _state(Todos(DbFile(str(path))))
+
+
+def test_search_ranks_exact_matches_first(tmp_path):
+    path = tmp_path / "todo.txt"
+    path.write_text("alphabet soup\nalpha test\nbeta\n")
+    todos = Todos(DbFile(str(path)))
+
+    assert todos._search.search("alpha") == [1, 0]
+    assert todos._search.search("alpha beta") == []
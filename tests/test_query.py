@@ -0,0 +1,81 @@
+from datetime import date, timedelta
+
+import pytest
+
+from webtodotxt.models.file import DbFile
+from webtodotxt.models.query import QueryError, compile_query
+from webtodotxt.models.todos import Todos
+
+
+def _day(offset: int) -> str:
+    return (date.today() + timedelta(days=offset)).isoformat()
+
+
+@pytest.fixture
+def todos(tmp_path):
+    path = tmp_path / "todo.txt"
+    path.write_text(
+        "\n".join(
+            [
+                f"(A) 2026-01-05 call mom +family @phone due:{_day(-1)}",
+                f"(C) 2026-02-10 write report +work due:{_day(0)} owner:bob",
+                f"2026-03-01 buy milk @shop due:{_day(7)}",
+                "x 2026-03-04 2026-03-02 pay rent +family owner:alice",
+                "(B) review patches +work",
+            ]
+        )
+        + "\n"
+    )
+    return Todos(DbFile(str(path)))
+
+
+def _match(todos, text):
+    tasks = todos.query_tasks(compile_query(text))
+    return [task.get_bare_description() for task in tasks]
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("", ["call mom", "write report", "buy milk", "pay rent", "review patches"]),
+        ("+family", ["call mom", "pay rent"]),
+        ("+family @phone", ["call mom"]),
+        ("-+family", ["write report", "buy milk", "review patches"]),
+        ("re", ["write report", "pay rent", "review patches"]),
+        ("-re", ["call mom", "buy milk"]),
+        ("pri:A", ["call mom"]),
+        ("pri:a..b", ["call mom", "review patches"]),
+        ("pri:C..A", ["call mom", "write report", "review patches"]),
+        ("pri:*", ["call mom", "write report", "review patches"]),
+        ("-pri:*", ["buy milk", "pay rent"]),
+        ("due:today", ["write report"]),
+        ("due:<today", ["call mom"]),
+        ("due:<=today", ["call mom", "write report"]),
+        ("due:>today", ["buy milk"]),
+        ("due:today-1..today+7", ["call mom", "write report", "buy milk"]),
+        ("due:today+1..", ["buy milk"]),
+        ("due:*", ["call mom", "write report", "buy milk"]),
+        ("created:2026-02-01..2026-03-01", ["write report", "buy milk"]),
+        ("done:2026-03-04", ["pay rent"]),
+        ("is:done", ["pay rent"]),
+        ("is:open,+work", ["write report", "review patches"]),
+        ("owner:*", ["write report", "pay rent"]),
+        ("owner:bob", ["write report"]),
+        ("-owner:*", ["call mom", "buy milk", "review patches"]),
+    ],
+)
+def test_match(todos, text, expected):
+    assert _match(todos, text) == expected
+
+
+@pytest.mark.parametrize(
+    "text",
+    ["due:tomorrow", "due:today+x", "due:2026-13-01", "pri:AB", "pri:1", "is:maybe"],
+)
+def test_invalid_terms(text):
+    with pytest.raises(QueryError):
+        compile_query(text)
+
+
+def test_words_exclude_negated_terms():
+    assert compile_query("alpha -beta +gamma").words == ["alpha"]
@@ -0,0 +1,70 @@
+import multiprocessing
+
+import pytest
+from limits import parse
+from limits.strategies import FixedWindowRateLimiter, SlidingWindowCounterRateLimiter
+
+from webtodotxt.models.ratelimit import SQLiteStorage
+
+
+LIMIT = parse("20 per hour")
+STRATEGIES = {
+    "fixed-window": FixedWindowRateLimiter,
+    "sliding-window-counter": SlidingWindowCounterRateLimiter,
+}
+
+
+def _hit(uri: str, strategy: str, attempts: int, results) -> None:
+    limiter = STRATEGIES[strategy](SQLiteStorage(uri))
+    results.put(sum(limiter.hit(LIMIT, "user") for _ in range(attempts)))
+
+
+@pytest.mark.parametrize("strategy", sorted(STRATEGIES))
+def test_limit_is_shared_across_processes(tmp_path, strategy):
+    uri = f"sqlite://{tmp_path}/limits.sqlite"
+    SQLiteStorage(uri)
+
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    workers = [
+        context.Process(target=_hit, args=(uri, strategy, 15, results))
+        for _ in range(2)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert results.get() + results.get() == 20
+    assert not STRATEGIES[strategy](SQLiteStorage(uri)).hit(LIMIT, "user")
+
+
+def test_expired_counter_starts_over(tmp_path):
+    storage = SQLiteStorage(f"sqlite://{tmp_path}/limits.sqlite")
+
+    assert storage.incr("key", 60) == 1
+    assert storage.incr("key", 60, 2) == 3
+    storage._connection().execute("UPDATE counters SET expiry = 0")
+    assert storage.get("key") == 0
+    assert storage.incr("key", 60) == 1
+
+
+def test_relative_uri(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    SQLiteStorage("sqlite://data/limits.sqlite").incr("key", 60)
+
+    assert (tmp_path / "data" / "limits.sqlite").exists()
+    assert SQLiteStorage("sqlite://data/limits.sqlite").get("key") == 1
+
+
+def test_absolute_uri(tmp_path):
+    SQLiteStorage(f"sqlite://{tmp_path}/limits.sqlite").incr("key", 60)
+
+    assert (tmp_path / "limits.sqlite").exists()
+    assert SQLiteStorage("sqlite://" + str(tmp_path / "limits.sqlite")).get("key") == 1
+
+
+def test_uri_without_path():
+    with pytest.raises(ValueError):
+        SQLiteStorage("sqlite://")
@@ -1,5 +1,9 @@
-from .extensions import login_manager, users_db, app
+from .extensions import login_manager, users_db, app, limiter
 from .routes import bp
+from .models.accounts import TodosCache, Users
+from .models.password import PasswordHasher, password_hasher
+from .models.ratelimit import SQLiteStorage
+import os
 
 
 def create_app(config_class=None):
@@ -10,6 +14,29 @@ def create_app(config_class=None):
 
     login_manager.init_app(app)
 
+    # Counters are shared by every worker on the host unless configured.
+    limits_path = os.path.join(app.instance_path, "ratelimit.sqlite")
+    app.config.setdefault(
+        "RATELIMIT_STORAGE_URI", f"{SQLiteStorage.STORAGE_SCHEME[0]}://{limits_path}"
+    )
+    app.config.setdefault("RATELIMIT_STRATEGY", "sliding-window-counter")
+    limiter.init_app(app)
+
+    users_db.set_todos_cache_limit(
+        app.config.get("TODOS_CACHE_MAX_BYTES", TodosCache.DEFAULT_MAX_BYTES)
+    )
+    password_hasher.configure(
+        max_workers=app.config.get(
+            "PASSWORD_HASH_MAX_WORKERS", PasswordHasher.DEFAULT_MAX_WORKERS
+        ),
+        max_queue=app.config.get(
+            "PASSWORD_HASH_MAX_QUEUE", PasswordHasher.DEFAULT_MAX_QUEUE
+        ),
+        method=app.config.get("PASSWORD_HASH_METHOD", PasswordHasher.DEFAULT_METHOD),
+    )
+    users_db.set_users_cache_limit(
+        app.config.get("USERS_CACHE_MAX_ENTRIES", Users.DEFAULT_MAX_USERS)
+    )
     users_db.load(app.config["ACCOUNTS_DB_DIRECTORY_PATH"])
 
     app.register_blueprint(bp)
@@ -14,6 +14,7 @@ from wtforms import validators
 from .models.accounts import AppUser
 from .models.flash import FlashType, flash_collect
 from .models.file import DbFile
+from .models.password import HasherBusy
 from .extensions import users_db
 from .token import generate_user_token
 
@@ -132,9 +133,13 @@ def _handle_password_change(user: AppUser, form: ChangePasswordForm) -> None:
     if not form.validate_on_submit():
         flash("Request could not be validated.", FlashType.ERROR.name)
 
-    success = user.change_password(
-        current=form.current_passw.data, new=form.new_passw.data
-    )
+    try:
+        success = user.change_password(
+            current=form.current_passw.data, new=form.new_passw.data
+        )
+    except HasherBusy:
+        flash("Server is busy, try again in a moment.", FlashType.ERROR.name)
+        return
 
     if success:
         flash("Password changed.", FlashType.INFO.name)
@@ -146,8 +151,9 @@ def _handle_app_settings_change(user: AppUser, form: AppSettingsForm) -> None:
     if not form.validate_on_submit():
         flash("Request could not be validated.", FlashType.ERROR.name)
 
-    user.set_show_last_n_done_tasks(form.show_n_last_done_tasks.data)
-    user.set_default_task(form.default_task.data)
+    with user.transaction():
+        user.set_show_last_n_done_tasks(form.show_n_last_done_tasks.data)
+        user.set_default_task(form.default_task.data)
 
     flash("App settings changed.", FlashType.INFO.name)
 
@@ -158,15 +164,18 @@ def _handle_archive_handle(user: AppUser, form: ArchiveForm) -> None:
 
     db_file = user.get_todo_file()
 
-    try:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        db_file_archive = DbFile(db_file.get_path() + f".{timestamp}.archive")
-        db_file_archive.create()
-        db_file.copy_to(db_file_archive.get_path())
-    except:
-        flash("Cannot create archive!.", FlashType.ERROR.name)
-
-    db_file.erase()
+    # Tasks added between the copy and the erase would be lost otherwise.
+    with db_file.exclusive_lock():
+        try:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            db_file_archive = DbFile(db_file.get_path() + f".{timestamp}.archive")
+            db_file_archive.create()
+            db_file.copy_to(db_file_archive.get_path())
+        except:
+            flash("Cannot create archive!.", FlashType.ERROR.name)
+            return
+
+        db_file.erase()
 
     flash("Archived.", FlashType.INFO.name)
 
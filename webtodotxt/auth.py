@@ -1,4 +1,5 @@
 from .models.accounts import AppUser
+from .models.password import HasherBusy
 from .django_http import url_has_allowed_host_and_scheme
 from flask import abort, render_template, request, redirect, url_for
 from flask_wtf import FlaskForm
@@ -34,7 +35,17 @@ def auth_authenticate_post():
     if user is None:
         return render_template("login.html", form=form)
 
-    if not user.check_password(form.password.data):
+    try:
+        valid = user.check_password(form.password.data)
+    except HasherBusy:
+        infos = [("error", "Too many login attempts, try again in a moment.")]
+        return (
+            render_template("login.html", form=form, infos=infos),
+            503,
+            {"Retry-After": "1"},
+        )
+
+    if not valid:
         return render_template(
             "login.html", form=form, infos=[("error", "Invalid username/password")]
         )
@@ -29,9 +29,10 @@ def init_user(users_root, username, full_name, password):
 
     config = Config(user_dir)
 
-    config.set_username(username)
-    config.set_full_name(full_name)
-    config.set_password(password)
+    with config.transaction():
+        config.set_username(username)
+        config.set_full_name(full_name)
+        config.set_password(password)
 
     click.echo(f"✅ User '{username}' initialized at {user_dir}")
 
@@ -0,0 +1,108 @@
+from flask import Response, jsonify, make_response, request
+from .django_http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from .models.file import DbFile
+from datetime import date, datetime
+import hashlib
+import time
+
+
+VERSION_HEADER = "X-File-Version"
+
+
+def version_of(stat_key: tuple | None) -> str | None:
+    """Quoted version token of a todo file state, sent back in If-Match."""
+    if stat_key is None:
+        return None
+
+    return quote_etag(hashlib.sha1(repr(stat_key).encode()).hexdigest()[:20])
+
+
+def file_version(db_file: DbFile) -> str | None:
+    return version_of(db_file.stat_key())
+
+
+def is_precondition_failed(version: str | None) -> bool:
+    """Evaluates If-Match (strong comparison) against the file version."""
+    if_match = request.headers.get("If-Match", None)
+    if if_match is None:
+        return False
+
+    etags = parse_etags(if_match)
+    if "*" in etags:
+        return version is None
+
+    return version is None or version not in etags
+
+
+def precondition_failed_response(version: str | None) -> Response:
+    response = jsonify({"status": "NOK", "message": "The todo file has changed."})
+    response.status_code = 412
+    return set_version(response, version)
+
+
+def set_version(response, version: str | None):
+    response = make_response(response)
+    if version is not None:
+        response.headers[VERSION_HEADER] = version
+
+    return response
+
+
+def file_validators(db_file: DbFile, *parts) -> tuple[str | None, int | None]:
+    """ETag and Last-Modified (epoch seconds) of a response built from db_file.
+
+    The ETag covers the file version plus every other input of the response
+    given in parts, so it can be computed without reading the file.
+    """
+    stat_key = db_file.stat_key()
+    if stat_key is None:
+        return (None, None)
+
+    digest = hashlib.sha1(repr((stat_key, parts)).encode()).hexdigest()
+    return (quote_etag(digest), stat_key[2] // 1_000_000_000)
+
+
+def start_of_today() -> int:
+    return int(datetime.combine(date.today(), datetime.min.time()).timestamp())
+
+
+def is_not_modified(etag: str | None, last_modified: int | None) -> bool:
+    """Evaluates If-None-Match, or If-Modified-Since when it is absent."""
+    if_none_match = request.headers.get("If-None-Match", None)
+    if if_none_match is not None:
+        if etag is None:
+            return False
+        etags = parse_etags(if_none_match)
+        return "*" in etags or _weak(etag) in (_weak(e) for e in etags)
+
+    if_modified_since = request.headers.get("If-Modified-Since", None)
+    if if_modified_since is None or last_modified is None:
+        return False
+
+    since = parse_http_date_safe(if_modified_since)
+    return since is not None and last_modified <= since
+
+
+def _weak(etag: str) -> str:
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def not_modified_response(etag: str | None, last_modified: int | None) -> Response:
+    return set_validators(Response(status=304), etag, last_modified)
+
+
+def set_validators(response, etag: str | None, last_modified: int | None):
+    response = make_response(response)
+    if response.status_code not in (200, 304):
+        return response
+
+    # Always revalidate, the page depends on the session too.
+    response.headers["Cache-Control"] = "private, no-cache"
+    if etag is not None:
+        response.headers["ETag"] = etag
+    # A second write within the same second would go unnoticed by clients
+    # revalidating with If-Modified-Since.
+    if last_modified is not None and last_modified < int(time.time()):
+        response.headers["Last-Modified"] = http_date(last_modified)
+
+    return response
@@ -7,6 +7,16 @@ class Config:
         "ACCOUNTS_DB_DIRECTORY_PATH", "accounts"
     )
     REMEMBER_COOKIE_DURATION = timedelta(days=30)
+    # Estimated memory of the cached parsed todo files, not their file size.
+    TODOS_CACHE_MAX_BYTES = int(
+        os.environ.get("TODOS_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+    )
+    USERS_CACHE_MAX_ENTRIES = int(os.environ.get("USERS_CACHE_MAX_ENTRIES", 256))
+    PASSWORD_HASH_MAX_WORKERS = int(os.environ.get("PASSWORD_HASH_MAX_WORKERS", 2))
+    PASSWORD_HASH_MAX_QUEUE = int(os.environ.get("PASSWORD_HASH_MAX_QUEUE", 16))
+    PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt")
+    API_RATE_LIMIT = os.environ.get("API_RATE_LIMIT", "600 per minute")
+    STREAM_MAIN_VIEW = os.environ.get("STREAM_MAIN_VIEW", "") not in ("", "0", "false")
 
 
 class ProductionHTTPConfig(Config):
@@ -1,15 +1,53 @@
 from flask import render_template, jsonify, request, redirect, url_for
 from flask_login import current_user
 from .auth import auth_display_login_form
+from .conditional import (
+    file_validators,
+    file_version,
+    is_not_modified,
+    is_precondition_failed,
+    not_modified_response,
+    precondition_failed_response,
+    set_validators,
+    set_version,
+    start_of_today,
+)
 from .extensions import users_db
-from .main import AppendTaskForm
+from .main import (
+    AppendTaskForm,
+    TASKS_PAGE_SIZE,
+    _decode_cursor,
+    _select_page,
+    _sort_by_done,
+)
+from .models.query import QueryError, compile_query
+from .models.todos import TaskWrapper, check_single_line
 from pytodotxt import Task
 from functools import wraps
+from datetime import date
 import json
 
 
-def with_todo_manager(json_errors=True):
-    """Decorator to inject TodoManager into a route after auth check."""
+MAX_TASKS_PAGE_SIZE = 500
+MAX_BATCH_OPERATIONS = 1000
+MAX_INGEST_TASKS = 10000
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl")
+
+
+def with_todo_manager(json_errors=True, exclusive=False, validators=None):
+    """Decorator to inject TodoManager into a route after auth check.
+
+    The todo file stays locked (exclusively for mutating routes) while the
+    route runs, so read-modify-write cycles of concurrent workers can't
+    interleave.
+
+    validators(db_file, *args, **kwargs) returns the (ETag, Last-Modified) of
+    the response; conditional requests are then answered with 304 before the
+    todo file is parsed.
+
+    Responses carry the file version; mutating routes given an If-Match
+    that doesn't match it fail with 412 without touching the file.
+    """
 
     def decorator(fn):
         @wraps(fn)
@@ -26,15 +64,42 @@ def with_todo_manager(json_errors=True):
                     else render_template("error.html", message=err["message"])
                 )
 
+            db_file = user.get_todo_file()
+            if validators is not None:
+                with db_file.shared_lock():
+                    etag, last_modified = validators(db_file, *args, **kwargs)
+                    if is_not_modified(etag, last_modified):
+                        response = not_modified_response(etag, last_modified)
+                        return set_version(response, file_version(db_file))
+
             todos = user.get_todos()
-            return fn(todos, *args, **kwargs)
+            lock = db_file.exclusive_lock() if exclusive else db_file.shared_lock()
+
+            # Todos lock first, as in every Todos method.
+            with todos.lock, lock:
+                if exclusive and is_precondition_failed(file_version(db_file)):
+                    return precondition_failed_response(file_version(db_file))
+
+                todos.refresh()
+                if validators is None:
+                    response = fn(todos, *args, **kwargs)
+                    return set_version(response, file_version(db_file))
+
+                etag, last_modified = validators(db_file, *args, **kwargs)
+                if is_not_modified(etag, last_modified):
+                    response = not_modified_response(etag, last_modified)
+                else:
+                    response = fn(todos, *args, **kwargs)
+                    response = set_validators(response, etag, last_modified)
+
+                return set_version(response, file_version(db_file))
 
         return wrapper
 
     return decorator
 
 
-@with_todo_manager(json_errors=False)
+@with_todo_manager(json_errors=False, exclusive=True)
 def crud_form_post(todos):
     form = AppendTaskForm()
 
@@ -42,14 +107,15 @@ def crud_form_post(todos):
         return render_template("error.html", message="Validation error.")
 
     try:
-        task = Task(form.task.data)
+        task = Task(check_single_line(form.task.data or ""))
         if not task.description:
             return redirect(url_for("main.index"))
+    except ValueError as e:
+        return render_template("error.html", message=str(e))
     except:
         return render_template("error.html", message="Task parsing error.")
 
-    todos.append_task(task)
-    todos.save()
+    todos.append_and_save(task)
 
     return redirect(url_for("main.index"))
 
@@ -67,7 +133,7 @@ def crud_api_post(username):
         user_request_data = json.loads(request.data.decode())
         task_line = user_request_data.get("task")
 
-        task = Task(task_line)
+        task = Task(check_single_line(task_line))
     except Exception as e:
         return (
             jsonify(
@@ -80,14 +146,79 @@ def crud_api_post(username):
             400,
         )
 
-    todos = requested_user.get_todos()
-    todos.append_task(task)
-    todos.save()
+    if task.description:
+        requested_user.get_todo_file().append_line(task.serialize())
 
     return jsonify({"status": "Ok"}), 200
 
 
-@with_todo_manager()
+def _iter_ingest_entries():
+    """Yields request entries, reading NDJSON bodies one line at a time.
+
+    NDJSON lines are yielded undecoded so a malformed line only fails itself.
+    """
+    content_type = request.mimetype
+
+    if content_type == "application/json":
+        entries = json.loads(request.get_data(cache=False).decode())
+        if not isinstance(entries, list):
+            raise ValueError("Expected a JSON array.")
+        yield from entries
+        return
+
+    if content_type not in NDJSON_CONTENT_TYPES:
+        raise ValueError("Content-type not supported.")
+
+    for raw in request.stream:
+        raw = raw.strip()
+        if raw:
+            yield raw
+
+
+def _parse_ingest_entry(entry) -> str:
+    if isinstance(entry, bytes):
+        entry = json.loads(entry.decode())
+
+    line = entry.get("task", None) if isinstance(entry, dict) else entry
+    if not isinstance(line, str):
+        raise ValueError("Expected a task string.")
+
+    task = Task(check_single_line(line))
+    if not task.description:
+        raise ValueError("Empty task.")
+
+    return task.serialize()
+
+
+def crud_api_ingest(username):
+    requested_user = users_db.get(username)
+
+    if requested_user is None:
+        return jsonify({"status": "NOK", "message": "Cannot load user"}), 400
+
+    lines = []
+    results = []
+    try:
+        for entry in _iter_ingest_entries():
+            if len(results) >= MAX_INGEST_TASKS:
+                raise ValueError(f"At most {MAX_INGEST_TASKS} tasks are allowed.")
+
+            try:
+                lines.append(_parse_ingest_entry(entry))
+                results.append({"status": "OK"})
+            except Exception as e:
+                results.append({"status": "NOK", "message": f"{e}"})
+    except ValueError as e:
+        message = f"Cannot parse request: {e}"
+        return jsonify({"status": "NOK", "message": message, "results": results}), 400
+
+    if lines:
+        requested_user.get_todo_file().append_lines(lines)
+
+    return jsonify({"status": "OK", "appended": len(lines), "results": results}), 200
+
+
+@with_todo_manager(exclusive=True)
 def crud_put(todos, line_number):
     if request.headers.get("Content-type", "") != "application/json":
         return jsonify({"status": "NOK", "message": "Content-type not supported."}), 400
@@ -101,30 +232,187 @@ def crud_put(todos, line_number):
     if task is None:
         return jsonify({"status": "NOK", "message": "Line number not found"})
 
+    return _update_task(todos, line_number)
+
+
+@with_todo_manager(exclusive=True)
+def crud_put_by_id(todos, task_id):
+    if request.headers.get("Content-type", "") != "application/json":
+        return jsonify({"status": "NOK", "message": "Content-type not supported."}), 400
+
+    position = todos.get_position(task_id)
+    if position is None:
+        return jsonify({"status": "NOK", "message": "Task not found"}), 404
+
+    return _update_task(todos, position)
+
+
+def _update_task(todos, position):
+    task = todos.get_task(position)
+
     try:
         data = json.loads(request.data.decode())
 
         action = data["action"]
 
+        new_task = None
         if action == "toggle":
             if data["key"] == "done":
                 new_task = task.toggle_done()
-                if new_task is not None:
-                    todos.append_task(new_task)
 
         elif action == "edit":
             if data["key"] == "line":
-                task.parse(data["value"])
+                try:
+                    task.parse(data["value"])
+                except ValueError as e:
+                    return jsonify({"status": "NOK", "message": str(e)}), 400
 
-        todos.save()
+        todos.save_task(position)
+        if new_task is not None:
+            todos.append_and_save(new_task)
 
     except:
+        todos.reload(incremental=False)
         return jsonify({"status": "NOK", "message": "Cannot parse response"}), 400
 
-    return jsonify({"status": "OK"}), 200
+    return jsonify({"status": "OK", "id": task.get_id()}), 200
+
+
+def _parse_batch() -> list:
+    if request.headers.get("Content-type", "") != "application/json":
+        raise ValueError("Content-type not supported.")
+
+    try:
+        data = json.loads(request.data.decode())
+    except ValueError:
+        raise ValueError("Cannot parse request.")
+
+    operations = data.get("operations", None) if isinstance(data, dict) else data
+    if not isinstance(operations, list):
+        raise ValueError("Expected a list of operations.")
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        raise ValueError(f"At most {MAX_BATCH_OPERATIONS} operations are allowed.")
+
+    return operations
 
 
-@with_todo_manager()
+def _apply_operation(todos, targets, operation):
+    """Returns the operation result and the task it leaves behind, if any."""
+    if not isinstance(operation, dict):
+        return ({"status": "NOK", "message": "Cannot parse operation."}, None)
+
+    action = operation.get("action", None)
+
+    if action == "append":
+        task = Task(str(operation.get("value", "")))
+        if not task.description:
+            return ({"status": "NOK", "message": "Empty task."}, None)
+        return ({"status": "OK"}, todos.append_task(task))
+
+    if action not in ("toggle", "edit", "delete"):
+        return ({"status": "NOK", "message": "Unknown action."}, None)
+
+    target = _operation_target(operation)
+    task = targets.get(target, None)
+    if task is None:
+        return ({"status": "NOK", "message": "Task not found"}, None)
+
+    if action == "toggle":
+        new_task = task.toggle_done()
+        if new_task is not None:
+            todos.append_task(new_task)
+    elif action == "edit":
+        if not isinstance(operation.get("value", None), str):
+            return ({"status": "NOK", "message": "Missing value."}, None)
+        task.parse(operation["value"])
+    else:
+        todos.remove_task(task)
+        for key in [key for key, value in targets.items() if value is task]:
+            targets[key] = None
+        task = None
+
+    return ({"status": "OK"}, task)
+
+
+def _operation_target(operation):
+    """("id", task id) or ("line", line number) addressed by an operation."""
+    if isinstance(operation.get("id", None), str):
+        return ("id", operation["id"])
+
+    line_number = operation.get("line_number", None)
+    if isinstance(line_number, int):
+        return ("line", line_number)
+
+    return None
+
+
+def _apply_batch(todos, operations):
+    """Applies operations in order and writes the file once.
+
+    Tasks are addressed by id or by line number; both refer to the file as
+    it was before the batch, so deleting a task doesn't shift the others.
+    """
+    with todos.batch():
+        targets = {}
+        for operation in operations:
+            if not isinstance(operation, dict):
+                continue
+            target = _operation_target(operation)
+            if target is None or target in targets:
+                continue
+            if target[0] == "id":
+                targets[target] = todos.get_task_by_id(target[1])
+            else:
+                targets[target] = todos.find_task(target[1])
+
+        results = []
+        for operation in operations:
+            try:
+                results.append(_apply_operation(todos, targets, operation))
+            except Exception as e:
+                results.append(({"status": "NOK", "message": f"{e}"}, None))
+
+    # Ids are assigned once the batch is saved.
+    for result, task in results:
+        if task is not None and task.get_id() is not None:
+            result["id"] = task.get_id()
+    results = [result for result, _ in results]
+
+    return jsonify({"status": "OK", "results": results}), 200
+
+
+@with_todo_manager(exclusive=True)
+def crud_batch(todos):
+    try:
+        operations = _parse_batch()
+    except ValueError as e:
+        return jsonify({"status": "NOK", "message": str(e)}), 400
+
+    return _apply_batch(todos, operations)
+
+
+def crud_api_batch(username):
+    requested_user = users_db.get(username)
+
+    if requested_user is None:
+        return jsonify({"status": "NOK", "message": "Cannot load user"}), 400
+
+    try:
+        operations = _parse_batch()
+    except ValueError as e:
+        return jsonify({"status": "NOK", "message": str(e)}), 400
+
+    db_file = requested_user.get_todo_file()
+    todos = requested_user.get_todos()
+    with todos.lock, db_file.exclusive_lock():
+        if is_precondition_failed(file_version(db_file)):
+            return precondition_failed_response(file_version(db_file))
+
+        response = _apply_batch(todos, operations)
+        return set_version(response, file_version(db_file))
+
+
+@with_todo_manager(exclusive=True)
 def crud_delete(todos, line_number):
     try:
         line_number = int(line_number)
@@ -140,7 +428,35 @@ def crud_delete(todos, line_number):
     return jsonify({"status": "OK"}), 200
 
 
-@with_todo_manager()
+@with_todo_manager(exclusive=True)
+def crud_delete_by_id(todos, task_id):
+    task = todos.get_task_by_id(task_id)
+    if task is None:
+        return jsonify({"status": "NOK", "message": "Task not found"}), 404
+
+    todos.delete_task(task.get_line_nr())
+
+    return jsonify({"status": "OK"}), 200
+
+
+def _task_validators(db_file, line_number):
+    return file_validators(db_file, "task", line_number)
+
+
+def _task_id_validators(db_file, task_id):
+    return file_validators(db_file, "task-id", task_id)
+
+
+@with_todo_manager(validators=_task_id_validators)
+def crud_get_by_id(todos, task_id):
+    task = todos.get_task_by_id(task_id)
+    if task is None:
+        return jsonify({"status": "NOK", "message": "Task not found"}), 404
+
+    return jsonify({"status": "OK", "id": task.get_id(), "task": task.get_line()})
+
+
+@with_todo_manager(validators=_task_validators)
 def crud_get(todos, line_number):
     try:
         line_number = int(line_number)
@@ -152,3 +468,70 @@ def crud_get(todos, line_number):
         return jsonify({"status": "NOK", "message": "Line number not found"})
 
     return jsonify({"status": "OK", "task": f"{task_line}"})
+
+
+def _date_to_json(value):
+    return None if value is None else value.isoformat()
+
+
+def _task_to_json(task: TaskWrapper) -> dict:
+    return {
+        "id": task.get_id(),
+        "line_number": task.get_line_nr(),
+        "is_completed": bool(task.is_completed),
+        "priority": task.get_priority(),
+        "description": task.get_bare_description(),
+        "creation_date": _date_to_json(task.get_creation_date()),
+        "completion_date": _date_to_json(task.get_completion_date()),
+        "due_date": _date_to_json(task.get_due_date()),
+        "contexts": list(task.get_contexts()),
+        "projects": list(task.get_projects()),
+        "attributes": {k: list(v) for k, v in task.get_attributes().items()},
+    }
+
+
+def _list_validators(db_file):
+    # Relative dates in filters ("due:<today") change the result at midnight.
+    etag, last_modified = file_validators(
+        db_file, "tasks", sorted(request.args.items(multi=True)), date.today()
+    )
+    if last_modified is not None:
+        last_modified = max(last_modified, start_of_today())
+
+    return (etag, last_modified)
+
+
+@with_todo_manager(validators=_list_validators)
+def crud_list(todos):
+    state = request.args.get("state", "undone")
+    if state not in ("done", "undone"):
+        return jsonify({"status": "NOK", "message": "Unknown state."}), 400
+
+    try:
+        limit = int(request.args.get("limit", TASKS_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"status": "NOK", "message": "Cannot parse limit."}), 400
+    limit = min(max(limit, 0), MAX_TASKS_PAGE_SIZE)
+
+    try:
+        query = compile_query(request.args.get("filter", ""))
+    except QueryError as e:
+        return jsonify({"status": "NOK", "message": str(e)}), 400
+
+    try:
+        after = _decode_cursor(request.args.get("after", None), state)
+    except ValueError:
+        return jsonify({"status": "NOK", "message": "Cannot parse cursor."}), 400
+
+    done, undone = _sort_by_done(todos.query_tasks(query))
+    page, next_cursor = _select_page(
+        done if state == "done" else undone, state, limit, after=after
+    )
+
+    return jsonify(
+        {
+            "status": "OK",
+            "tasks": [_task_to_json(task) for task in page],
+            "next": next_cursor,
+        }
+    )
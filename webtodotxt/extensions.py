@@ -16,10 +16,9 @@ csrf = CSRFProtect(app)
 
 users_db = Users()
 
+# Storage and strategy come from RATELIMIT_STORAGE_URI / RATELIMIT_STRATEGY,
+# see create_app.
 limiter = Limiter(
     get_remote_address,
-    app=app,
     default_limits=["50 per minute"],
-    storage_uri="memory://",
-    strategy="fixed-window"
 )
@@ -1,16 +1,33 @@
-from flask import render_template, request
+from flask import current_app, render_template, request, session, stream_template
 from flask_login import current_user
 from flask_wtf import FlaskForm
+from flask_wtf.csrf import generate_csrf
 from wtforms import (
     SubmitField,
     TextAreaField,
     validators,
 )
 from .auth import auth_display_login_form
+from .conditional import (
+    file_validators,
+    file_version,
+    is_not_modified,
+    not_modified_response,
+    set_validators,
+    set_version,
+    version_of,
+)
 from .extensions import users_db
 from .models.accounts import AppUser
+from .models.query import QueryError, compile_query
+from .models.todos import TaskWrapper
 from datetime import date
 import calendar
+import heapq
+import time
+
+
+TASKS_PAGE_SIZE = 50
 
 
 class AppendTaskForm(FlaskForm):
@@ -30,72 +47,141 @@ def _sort_by_done(tasks):
     return (done, undone)
 
 
-def _sort_by_prio_and_date(tasks):
-    def _sort_func(t):
+def _prio_and_date_key(task: TaskWrapper):
+    return (task.get_sort_key(), task.get_line_nr())
 
-        created = t.get_creation_date()
 
-        return (
-            "Z" if t.get_priority() is None else t.get_priority(),
-            (-created.toordinal() if isinstance(created, date) else float("-inf")),
-        )
+def _completion_date_key(task: TaskWrapper):
+    return (task.get_completion_sort_key(), task.get_line_nr())
+
+
+def _select_first(tasks, key, limit=-1, after=None):
+    """First `limit` tasks ordered by key (all for negative limit).
+
+    Only tasks ordered after the `after` cursor key are considered. Returns
+    the selected tasks and the cursor of the next page, if there is one.
+    """
+    if after is not None:
+        tasks = [task for task in tasks if key(task) > after]
+
+    if limit < 0:
+        return (sorted(tasks, key=key), None)
+
+    if limit == 0:
+        return ([], None)
+
+    selected = heapq.nsmallest(limit + 1, tasks, key=key)
+    if len(selected) <= limit:
+        return (selected, None)
+
+    return (selected[:limit], key(selected[limit - 1]))
+
+
+def _iter_sorted(tasks, key):
+    """Yields tasks ordered by key, paying O(log n) per task on demand."""
+    heap = [(key(task), idx, task) for idx, task in enumerate(tasks)]
+    heapq.heapify(heap)
+
+    while heap:
+        yield heapq.heappop(heap)[-1]
+
+
+def _encode_cursor(cursor):
+    """Cursor keys are (completion, line) or ((priority, creation), line)."""
+    if cursor is None:
+        return None
+
+    sort_key, line_nr = cursor
+    parts = list(sort_key) if isinstance(sort_key, tuple) else [sort_key]
+    return ":".join(str(part) for part in [*parts, line_nr])
+
+
+def _decode_number(raw):
+    return float(raw) if "inf" in raw else int(raw)
+
+
+def _decode_cursor(raw, state):
+    """Cursor of a done or undone page, ValueError if it has another shape."""
+    if not raw:
+        return None
 
-    return sorted(tasks, key=_sort_func)
+    parts = raw.split(":")
+    if state == "done" and len(parts) == 2:
+        return (_decode_number(parts[0]), int(parts[1]))
+    if state == "undone" and len(parts) == 3:
+        return ((parts[0], _decode_number(parts[1])), int(parts[2]))
+
+    raise ValueError(f"Invalid {state} cursor.")
+
+
+def _select_page(tasks, state, limit, after=None):
+    """A page of done or undone tasks in display order, plus next cursor."""
+    key = _completion_date_key if state == "done" else _prio_and_date_key
+    page, cursor = _select_first(tasks, key, limit, after)
+
+    return (page, _encode_cursor(cursor))
 
 
 def _count_passed_due(tasks):
+    today = date.today()
+
     n = 0
     for task in tasks:
-        if not task.is_completed and task.get_due_date() is not None:
-            if task.get_due_date() < date.today():
-                n += 1
+        due = task.get_due_date()
+        if due is not None and not task.is_completed and due < today:
+            n += 1
 
     return n
 
 
-def _sort_by_completion_date(tasks):
-    def _sort_funct(t):
-        return (
-            -t.get_completion_date().toordinal()
-            if t.get_completion_date()
-            else float("-inf")
-        )
+def _get_filters():
+    return compile_query(request.args.get("filter", ""))
 
-    return sorted(tasks, key=_sort_funct)
 
+def _apply_filters(todos):
+    return todos.query_tasks(_get_filters())
 
-def _get_filters():
-    raw_filter = request.args.get("filter", "")
 
-    tokens = [t.strip() for t in raw_filter.replace(",", " ").split() if t.strip()]
+def _use_streaming():
+    stream = request.args.get("stream", None)
+    if stream is not None:
+        return stream not in ("0", "false", "")
 
-    projects: list[str] = [t[1:] for t in tokens if t.startswith("+")]
-    contexts = [t[1:] for t in tokens if t.startswith("@")]
-    return (projects, contexts)
+    return current_app.config.get("STREAM_MAIN_VIEW", False)
 
 
-def _apply_filters(tasks):
-    projects, contexts = _get_filters()
+def _csrf_state():
+    """Session CSRF secret and, with a time limit, the window it was signed in.
 
-    if not any([len(projects), len(contexts)]):
-        return tasks
+    A revalidated page keeps its old signed token, so the ETag changes before
+    that token could expire.
+    """
+    config = current_app.config
+    raw_token = session.get(config.get("WTF_CSRF_FIELD_NAME", "csrf_token"), None)
+    time_limit = config.get("WTF_CSRF_TIME_LIMIT", 3600)
+    window = int(time.time() // time_limit) if time_limit else None
 
+    return (raw_token, window)
 
-    filtered = []
-    for task in tasks:
-        task_projects = (
-            set() if task.get_projects() is None else set(task.get_projects())
-        )
-        task_contexts = (
-            set() if task.get_contexts() is None else set(task.get_contexts())
-        )
 
-        if all(elem in task_projects for elem in projects) and all(
-            elem in task_contexts for elem in contexts
-        ):
-            filtered.append(task)
+def _main_validators(requested_user: AppUser):
+    etag, _ = file_validators(
+        requested_user.get_todo_file(),
+        "main",
+        requested_user.id,
+        request.host_url,
+        sorted(request.args.items(multi=True)),
+        _use_streaming(),
+        date.today(),
+        requested_user.full_name,
+        requested_user.get_show_last_n_done_tasks(),
+        requested_user.get_default_task_formated(),
+        requested_user.get_quick_filters(),
+        _csrf_state(),
+    )
 
-    return filtered
+    # The page embeds session state, only the ETag is reliable.
+    return (etag, None)
 
 
 def main_get():
@@ -107,31 +193,86 @@ def main_get():
     if requested_user is None:
         return render_template("error.html", message="User not found.")
 
-    todos = requested_user.get_todos()
-
-    tasks = _apply_filters(todos.get_tasks())
+    etag, last_modified = _main_validators(requested_user)
+    if is_not_modified(etag, last_modified):
+        response = not_modified_response(etag, last_modified)
+        return set_version(response, file_version(requested_user.get_todo_file()))
 
-    done, undone = _sort_by_done(tasks)
-
-    undone = _sort_by_prio_and_date(undone)
-    done = _sort_by_completion_date(done)
+    todos = requested_user.get_todos()
+    streaming = _use_streaming()
+
+    with todos.lock:
+        infos = []
+        # Further pages are loaded with the filter the page was built with.
+        list_filter = request.args.get("filter", "")
+        try:
+            tasks = _apply_filters(todos)
+        except QueryError as e:
+            infos.append(("error", str(e)))
+            tasks = todos.get_tasks()
+            list_filter = ""
+
+        if streaming:
+            # The body is rendered after the lock is released.
+            tasks = [task.snapshot() for task in tasks]
+
+        done, undone = _sort_by_done(tasks)
+
+        n_task_done = requested_user.get_show_last_n_done_tasks()
+        try:
+            done_after = _decode_cursor(request.args.get("done_after", None), "done")
+        except ValueError:
+            done_after = None
+
+        if streaming:
+            undone_page, undone_next = _iter_sorted(undone, _prio_and_date_key), None
+        else:
+            undone_page, undone_next = _select_page(undone, "undone", TASKS_PAGE_SIZE)
 
-    n_task_done = requested_user.get_show_last_n_done_tasks()
-    if n_task_done >= 0:
-        done = done[:n_task_done]
+        if streaming and n_task_done < 0:
+            if done_after is not None:
+                done = [t for t in done if _completion_date_key(t) > done_after]
+            done_count = len(done)
+            done_page, done_next = _iter_sorted(done, _completion_date_key), None
+        else:
+            done_page, done_next = _select_page(
+                done,
+                "done",
+                TASKS_PAGE_SIZE if n_task_done < 0 else n_task_done,
+                after=done_after,
+            )
+            done_count = len(done_page)
+
+        form = AppendTaskForm()
+        form.task.default = requested_user.get_default_task_formated()
+        form.task.data = requested_user.get_default_task_formated()
+
+        context = dict(
+            tasks_done=done_page,
+            tasks_undone=undone_page,
+            undone_count=len(undone),
+            undone_next=undone_next,
+            done_count=done_count,
+            done_next=done_next,
+            done_lazy=n_task_done < 0 and not streaming,
+            form=form,
+            current_date=date.today(),
+            calendar=calendar.month(date.today().year, date.today().month),
+            full_name=requested_user.full_name,
+            quick_filters=requested_user.get_quick_filters(),
+            due_tasks=_count_passed_due(undone),
+            infos=infos,
+            list_filter=list_filter,
+            file_version=version_of(todos.get_stat_key()),
+        )
 
-    form = AppendTaskForm()
-    form.task.default = requested_user.get_default_task_formated()
-    form.task.data = requested_user.get_default_task_formated()
+        if streaming:
+            # The session cookie is sent before the body, make sure the CSRF
+            # token used inside the template is already stored in it.
+            generate_csrf()
+            response = stream_template("main.html", **context)
+        else:
+            response = render_template("main.html", **context)
 
-    return render_template(
-        "main.html",
-        tasks_done=done,
-        tasks_undone=undone,
-        form=form,
-        current_date=date.today(),
-        calendar=calendar.month(date.today().year, date.today().month),
-        full_name=requested_user.full_name,
-        quick_filters=requested_user.get_quick_filters(),
-        due_tasks=_count_passed_due(undone),
-    )
+    response = set_validators(response, etag, last_modified)
+    return set_version(response, context["file_version"])
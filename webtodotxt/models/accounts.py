@@ -1,44 +1,141 @@
 import os
+import hashlib
+import hmac
 import secrets
+import threading
+from collections import OrderedDict
 from .file import DbFile
 from .user import Config, User
 from .todos import Todos
 from datetime import date
 
 
-class WebTodoTxtConfig(Config):
-    def __init__(self, directory) -> None:
-        super().__init__(directory)
+class TodosCache:
+    """LRU cache of parsed todo files.
+
+    max_bytes bounds the estimated memory of the parsed entries (see
+    Todos.approx_size), which is tens of times the size of the files.
+    """
+
+    DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, tuple[int, Todos]] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, db_file: DbFile) -> Todos:
+        """Cached Todos of db_file, reloaded if the file changed.
+
+        The Todos is shared: hold its lock while reading it.
+        """
+        path = db_file.get_path()
+
+        with self._lock:
+            entry = self._entries.get(path, None)
+            if entry is not None:
+                self._entries.move_to_end(path)
+
+        if entry is None:
+            todos = Todos(db_file)
+        else:
+            todos = entry[1]
+            with todos.lock:
+                if todos.get_stat_key() == db_file.stat_key():
+                    return todos
+                todos.reload()
+
+        self._put(path, todos)
+        return todos
+
+    def _put(self, path: str, todos: Todos) -> None:
+        size = todos.approx_size()
+
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old is not None:
+                self._size -= old[0]
 
-        if self._data.get("webtodotxt", None) is None:
-            self._data["webtodotxt"] = {
-                "api_token": "",
-                "show_last_n_done_tasks": -1,
-                "default_task": "",
-                "quick_filters": {},
-            }
-            self._save()
+            if size > self.max_bytes:
+                return
 
-        self._app_config = self._data["webtodotxt"]
+            self._entries[path] = (size, todos)
+            self._size += size
+
+            while self._size > self.max_bytes:
+                _, (evicted_size, _) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+
+class TokenIndex:
+    """API token digest to username, for users whose token has been seen."""
+
+    def __init__(self) -> None:
+        self._usernames: dict[str, str] = {}
+        self._digests: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def update(self, username: str, token: str | None) -> None:
+        with self._lock:
+            old = self._digests.pop(username, None)
+            if old is not None and self._usernames.get(old, None) == username:
+                del self._usernames[old]
+
+            if token:
+                digest = self.digest(token)
+                self._digests[username] = digest
+                self._usernames[digest] = username
+
+    def find(self, token: str) -> str | None:
+        with self._lock:
+            return self._usernames.get(self.digest(token), None)
+
+
+class WebTodoTxtConfig(Config):
+    DEFAULTS = {
+        **Config.DEFAULTS,
+        "webtodotxt": {
+            "api_token": "",
+            "show_last_n_done_tasks": -1,
+            "default_task": "",
+            "quick_filters": {},
+        },
+    }
+
+    @property
+    def _app_config(self) -> dict:
+        return self._section("webtodotxt")
 
     def set_token(self):
-        self._app_config["api_token"] = secrets.token_urlsafe(32)
-        self._save()
-        return self.get_token()
+        with self.transaction():
+            self._app_config["api_token"] = secrets.token_urlsafe(32)
+            return self.get_token()
 
     def get_token(self):
         return self._app_config.get("api_token", None)
 
+    def check_token(self, token: str) -> bool:
+        current = self.get_token()
+        if not current or not isinstance(token, str):
+            return False
+
+        return hmac.compare_digest(current.encode(), token.encode())
+
     def set_default_task(self, string):
-        self._app_config["default_task"] = string
-        self._save()
+        with self.transaction():
+            self._app_config["default_task"] = string
 
     def get_default_task(self):
         return self._app_config.get("default_task", "")
 
     def set_show_last_n_done_tasks(self, n_tasks):
-        self._app_config["show_last_n_done_tasks"] = n_tasks
-        self._save()
+        with self.transaction():
+            self._app_config["show_last_n_done_tasks"] = n_tasks
 
     def get_show_last_n_done_tasks(self):
         return self._app_config.get("show_last_n_done_tasks", -1)
@@ -47,29 +144,43 @@ class WebTodoTxtConfig(Config):
         return self._app_config.get("quick_filters", {})
 
     def set_quick_filters(self, new_quick_filters: dict):
-        quick_filters = self._app_config.get("quick_filters", None)
-        if quick_filters is None:
-            self._app_config.update({"quick_filters": {}})
-
-        self._app_config["quick_filters"] = new_quick_filters
-        self._save()
+        with self.transaction():
+            self._app_config["quick_filters"] = new_quick_filters
 
 
 class AppUser(User):
     TODO_FILE_NAME = "todo.txt"
     APP_DIRECTORY = "webtodotxt"
 
-    def __init__(self, id, user_directory):
+    def __init__(
+        self,
+        id,
+        user_directory,
+        todos_cache: TodosCache | None = None,
+        token_index: TokenIndex | None = None,
+    ):
         super().__init__(id, WebTodoTxtConfig(user_directory))
 
         self._app_path = os.path.join(user_directory, self.APP_DIRECTORY)
+        self._todos_cache = todos_cache
+        self._token_index = token_index
+
+        if token_index is not None:
+            token_index.update(self.id, self.get_token())
 
     def set_token(self):
-        return self._config.set_token()
+        token = self._config.set_token()
+        if self._token_index is not None:
+            self._token_index.update(self.id, token)
+        return token
 
     def get_token(self):
         return self._config.get_token()
 
+    def check_token(self, token: str) -> bool:
+        """Constant-time comparison with the current (not revoked) token."""
+        return self._config.check_token(token)
+
     def set_default_task(self, string):
         self._config.set_default_task(string)
 
@@ -103,7 +214,10 @@ class AppUser(User):
     def get_todos(self) -> Todos:
         db_file = self.get_todo_file()
 
-        return Todos(db_file)
+        if self._todos_cache is None:
+            return Todos(db_file)
+
+        return self._todos_cache.get(db_file)
 
     def get_quick_filters(self):
         return self._config.get_quick_filters()
@@ -113,22 +227,110 @@ class AppUser(User):
 
 
 class Users:
+    """Accounts resolved on demand from the accounts directory.
+
+    Loaded users are kept in a bounded LRU. A change of the accounts
+    directory mtime (a user directory added or removed) drops cached users
+    whose config is gone; unknown names are looked up on disk directly, so
+    new users show up without a restart.
+    """
+
+    DEFAULT_MAX_USERS = 256
+
     def __init__(self):
-        self._users_db = {}
+        self._db_path: str | None = None
+        self._db_mtime: int | None = None
+        self._users: OrderedDict[str, AppUser] = OrderedDict()
+        self._max_users = self.DEFAULT_MAX_USERS
+        self._lock = threading.Lock()
+        self._todos_cache = TodosCache()
+        self._token_index = TokenIndex()
+
+    def set_todos_cache_limit(self, max_bytes: int) -> None:
+        self._todos_cache.max_bytes = max_bytes
+
+    def set_users_cache_limit(self, max_users: int) -> None:
+        with self._lock:
+            self._max_users = max_users
+            self._evict()
 
     def load(self, db_path: str) -> None:
         if not os.path.exists(db_path):
             raise FileNotFoundError(f"Database path {db_path} does not exist.")
 
-        with os.scandir(db_path) as entries:
-            for entry in entries:
-                user_directory = os.path.join(db_path, entry.name)
-                if not Config.config_file_exists(user_directory):
-                    continue
+        with self._lock:
+            self._db_path = db_path
+            self._db_mtime = os.stat(db_path).st_mtime_ns
+            self._users.clear()
+
+    def _user_directory(self, username) -> str | None:
+        if self._db_path is None or not isinstance(username, str):
+            return None
+
+        if username in ("", ".", "..") or os.path.basename(username) != username:
+            return None
 
-                user = AppUser(id=entry.name, user_directory=user_directory)
+        return os.path.join(self._db_path, username)
 
-                self._users_db[user.id] = user
+    def _check_db_directory(self) -> None:
+        try:
+            mtime = os.stat(self._db_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+
+        if mtime == self._db_mtime:
+            return
+
+        self._db_mtime = mtime
+        for username in list(self._users):
+            if not Config.config_file_exists(os.path.join(self._db_path, username)):
+                del self._users[username]
+
+    def _evict(self) -> None:
+        while len(self._users) > max(self._max_users, 0):
+            self._users.popitem(last=False)
 
     def get(self, username) -> AppUser | None:
-        return self._users_db.get(username, None)
+        user_directory = self._user_directory(username)
+        if user_directory is None:
+            return None
+
+        with self._lock:
+            self._check_db_directory()
+            user = self._users.get(username, None)
+            if user is not None:
+                self._users.move_to_end(username)
+                return user
+
+        if not Config.config_file_exists(user_directory):
+            return None
+
+        user = AppUser(
+            id=username,
+            user_directory=user_directory,
+            todos_cache=self._todos_cache,
+            token_index=self._token_index,
+        )
+
+        with self._lock:
+            user = self._users.setdefault(username, user)
+            self._users.move_to_end(username)
+            self._evict()
+
+        return user
+
+    def get_by_token(self, token: str, username: str | None = None) -> AppUser | None:
+        """User owning the API token, checked against its current config.
+
+        Tokens rotated by another worker are not indexed here yet; username
+        is then used as the candidate instead.
+        """
+        if not isinstance(token, str):
+            return None
+
+        user = self.get(self._token_index.find(token) or username)
+        if user is None or not user.check_token(token):
+            return None
+
+        self._token_index.update(user.id, token)
+        return user
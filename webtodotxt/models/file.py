@@ -1,7 +1,137 @@
 import os
+import errno
+import fcntl
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+COPY_CHUNK_SIZE = 1024 * 1024
+LINESEP_PROBE_SIZE = 64 * 1024
+
+_COPY_FALLBACK_ERRNOS = {
+    errno.EXDEV,
+    errno.ENOSYS,
+    errno.EINVAL,
+    errno.EOPNOTSUPP,
+    errno.EBADF,
+}
+
+
+def detect_linesep(data: bytes, default: str = os.linesep) -> str:
+    """Separator of the first line break in data, default if there is none."""
+    cr = data.find(b"\r")
+    lf = data.find(b"\n")
+    if cr == -1 and lf == -1:
+        return default
+    if cr == -1 or (lf != -1 and lf < cr):
+        return "\n"
+
+    return "\r\n" if data[cr + 1 : cr + 2] == b"\n" else "\r"
+
+
+def _copy_fd(src_fd: int, dst_fd: int) -> None:
+    """Copy src_fd to dst_fd in the kernel when possible, in chunks otherwise."""
+    for kernel_copy in (
+        getattr(os, "copy_file_range", None),
+        _sendfile,
+    ):
+        if kernel_copy is None:
+            continue
+
+        try:
+            while kernel_copy(src_fd, dst_fd, COPY_CHUNK_SIZE) > 0:
+                pass
+            return
+        except OSError as e:
+            if e.errno not in _COPY_FALLBACK_ERRNOS:
+                raise
+
+    while chunk := os.read(src_fd, COPY_CHUNK_SIZE):
+        view = memoryview(chunk)
+        while view:
+            view = view[os.write(dst_fd, view) :]
+
+
+def _sendfile(src_fd: int, dst_fd: int, count: int) -> int:
+    return os.sendfile(dst_fd, src_fd, None, count)
+
+
+class LockMetrics:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._stats: dict[str, dict] = {}
+
+    def record(self, mode: str, wait: float, contended: bool) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(
+                mode,
+                {"acquired": 0, "contended": 0, "total_wait": 0.0, "max_wait": 0.0},
+            )
+            stats["acquired"] += 1
+            stats["contended"] += int(contended)
+            stats["total_wait"] += wait
+            stats["max_wait"] = max(stats["max_wait"], wait)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {mode: dict(stats) for mode, stats in self._stats.items()}
+
+
+lock_metrics = LockMetrics()
+
+_held_locks = threading.local()
+
+
+@contextmanager
+def _file_lock(lock_path: str, operation: int):
+    """flock() based lock, re-entrant within a thread.
+
+    Locks live on a sidecar file because atomic saves replace the inode of
+    the data file itself.
+    """
+    held: dict = _held_locks.__dict__.setdefault("locks", {})
+    entry = held.get(lock_path, None)
+
+    if entry is not None:
+        if operation == fcntl.LOCK_EX and entry["operation"] == fcntl.LOCK_SH:
+            raise RuntimeError(f"Cannot upgrade shared lock on {lock_path}.")
+
+        entry["depth"] += 1
+        try:
+            yield
+        finally:
+            entry["depth"] -= 1
+        return
+
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        start = time.perf_counter()
+        contended = False
+        try:
+            fcntl.flock(fd, operation | fcntl.LOCK_NB)
+        except BlockingIOError:
+            contended = True
+            fcntl.flock(fd, operation)
+
+        lock_metrics.record(
+            "exclusive" if operation == fcntl.LOCK_EX else "shared",
+            time.perf_counter() - start,
+            contended,
+        )
+
+        held[lock_path] = {"operation": operation, "depth": 1}
+        try:
+            yield
+        finally:
+            del held[lock_path]
+    finally:
+        os.close(fd)
+
 
 class DbFile:
     BACKUP_FILE_NAME_SUFFIX = ".bak"
+    LOCK_FILE_NAME_SUFFIX = ".lock"
 
     def __init__(self, file_path: str):
         self._dir = os.path.dirname(file_path)
@@ -11,10 +141,20 @@ class DbFile:
         self._backup_file_path = os.path.join(
             self._dir, self._file_name + self.BACKUP_FILE_NAME_SUFFIX
         )
+        lock_file_name = "." + self._file_name + self.LOCK_FILE_NAME_SUFFIX
+        self._lock_file_path = os.path.abspath(os.path.join(self._dir, lock_file_name))
 
     def exists(self) -> bool:
         return os.path.exists(self._file_path)
 
+    def stat_key(self) -> tuple | None:
+        try:
+            st = os.stat(self._file_path)
+        except FileNotFoundError:
+            return None
+
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
     def create(self):
         if self.exists():
             raise FileExistsError(f"File {self._file_path} already exists.")
@@ -24,12 +164,118 @@ class DbFile:
         with open(self._file_path, mode="w", newline="") as _:
             pass
 
+    def shared_lock(self):
+        return _file_lock(self._lock_file_path, fcntl.LOCK_SH)
+
+    def exclusive_lock(self):
+        return _file_lock(self._lock_file_path, fcntl.LOCK_EX)
+
     def erase(self):
         if not os.path.exists(self._file_path):
             raise FileNotFoundError(f"Provided path does not exist {self._file_path}.")
 
-        with open(self._file_path, mode="r+", newline="") as file:
-            file.truncate(0)
+        self.atomic_write(b"")
+
+    def append_line(
+        self, line: str, linesep: str = "\n", encoding: str = "utf-8"
+    ) -> int:
+        return self.append_lines([line], linesep, encoding)[0]
+
+    def append_lines(
+        self, lines: list[str], linesep: str = "\n", encoding: str = "utf-8"
+    ) -> list[int]:
+        """Appends lines with a single write, returns their byte offsets.
+
+        Lines are separated like the ones already in the file, linesep is
+        only used for a file without line breaks.
+        """
+        with self.exclusive_lock():
+            return self._append_lines(lines, linesep, encoding)
+
+    def _append_lines(self, lines: list[str], linesep: str, encoding: str) -> list[int]:
+        fd = os.open(self._file_path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            size = os.fstat(fd).st_size
+            linesep = detect_linesep(os.pread(fd, LINESEP_PROBE_SIZE, 0), linesep)
+            sep = linesep.encode(encoding)
+
+            prefix = b""
+            if size > 0 and os.pread(fd, 1, size - 1) not in (b"\n", b"\r"):
+                prefix = sep
+
+            encoded = [line.encode(encoding) for line in lines]
+            offsets = []
+            offset = size + len(prefix)
+            for data in encoded:
+                offsets.append(offset)
+                offset += len(data) + len(sep)
+
+            if encoded:
+                data = prefix + sep.join(encoded) + sep
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view) :]
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+
+        return offsets
+
+    def replace_range(self, offset: int, old_data: bytes, new_data: bytes) -> bool:
+        with self.exclusive_lock(), open(self._file_path, "r+b") as file:
+            file.seek(offset)
+            if file.read(len(old_data)) != old_data:
+                return False
+
+            resized = len(old_data) != len(new_data)
+            tail = file.read() if resized else b""
+
+            file.seek(offset)
+            file.write(new_data)
+            if resized:
+                file.write(tail)
+                file.truncate()
+            file.flush()
+            os.fsync(file.fileno())
+
+        return True
+
+    @contextmanager
+    def atomic_writer(self):
+        """Yields a temporary file which replaces this file on success."""
+        directory = self._dir or "."
+        fd, tmp_path = tempfile.mkstemp(
+            dir=directory, prefix=f".{self._file_name}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                try:
+                    os.fchmod(tmp.fileno(), os.stat(self._file_path).st_mode & 0o777)
+                except FileNotFoundError:
+                    pass
+
+                yield tmp
+
+                tmp.flush()
+                os.fsync(tmp.fileno())
+
+            os.replace(tmp_path, self._file_path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    def atomic_write(self, data: bytes):
+        with self.atomic_writer() as file:
+            file.write(data)
 
     def backup(self):
         self.copy_to(self._backup_file_path)
@@ -53,18 +299,18 @@ class DbFile:
 
         with (
             open(src_file, "rb") as src,
-            open(self._file_path, "wb") as dst,
+            self.atomic_writer() as dst,
         ):
-            dst.write(src.read())
+            _copy_fd(src.fileno(), dst.fileno())
 
     def copy_to(self, dst_file):
         if not os.path.exists(self._file_path):
             raise FileNotFoundError(f"Provided path does not exist {self._file_path}.")
         with (
             open(self._file_path, "rb") as src,
-            open(dst_file, "wb") as dst,
+            DbFile(dst_file).atomic_writer() as dst,
         ):
-            dst.write(src.read())
+            _copy_fd(src.fileno(), dst.fileno())
 
     def get_path(self) -> str:
         return os.path.join(self._dir, self._file_name)
@@ -0,0 +1,423 @@
+import bisect
+import math
+import re
+from array import array
+from itertools import chain
+
+
+def iter_bits(bits: int):
+    """Yields positions of the set bits, lowest first."""
+    digits = bin(bits)[:1:-1]
+    pos = digits.find("1")
+    while pos != -1:
+        yield pos
+        pos = digits.find("1", pos + 1)
+
+
+def _drop_bit(bits: int, idx: int) -> int:
+    low = bits & ((1 << idx) - 1)
+    return low | ((bits >> (idx + 1)) << idx)
+
+
+def bits_of(positions: list[int]) -> int:
+    """Bitset of ascending positions, built with a single int allocation.
+
+    OR-ing bit by bit reallocates an ever larger int for every position.
+    """
+    if len(positions) <= 1:
+        return 1 << positions[0] if positions else 0
+
+    data = bytearray((positions[-1] >> 3) + 1)
+    for pos in positions:
+        data[pos >> 3] |= 1 << (pos & 7)
+
+    return int.from_bytes(data, "little")
+
+
+class BitsetIndex:
+    """Inverted index from keys to a bitset of task positions in Todos.
+
+    Subclasses define which keys a task has, one frozenset per field.
+    """
+
+    FIELDS = 1
+    # Most key updates sync applies before rebuilding instead.
+    SYNC_LIMIT = 4096
+
+    def __init__(self) -> None:
+        self._index: list[dict[str, int]] = [{} for _ in range(self.FIELDS)]
+        self._keys: list[tuple[frozenset, ...]] = []
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _task_keys(self, wrapper) -> tuple[frozenset, ...]:
+        raise NotImplementedError()
+
+    def _key_added(self, field: int, key: str) -> None:
+        pass
+
+    def _key_removed(self, field: int, key: str) -> None:
+        pass
+
+    def _keys_built(self, field: int, keys) -> None:
+        """Called by build with every key of the field instead of _key_added."""
+        pass
+
+    def build(self, wrappers) -> None:
+        self._keys = [self._task_keys(wrapper) for wrapper in wrappers]
+
+        positions: list[dict] = [{} for _ in range(self.FIELDS)]
+        for idx, task_keys in enumerate(self._keys):
+            for field, keys in enumerate(task_keys):
+                field_positions = positions[field]
+                for key in keys:
+                    field_positions.setdefault(key, []).append(idx)
+
+        for field, field_positions in enumerate(positions):
+            self._index[field] = {
+                key: self._entry(key_positions)
+                for key, key_positions in field_positions.items()
+            }
+            self._keys_built(field, self._index[field])
+
+    def _entry(self, positions: list[int]):
+        return bits_of(positions)
+
+    def _truncate_cost(self) -> int:
+        return sum(len(index) for index in self._index)
+
+    def sync(self, wrappers, start: int, end_old: int, end_new: int) -> None:
+        """Indexes wrappers, which differ from the indexed tasks only in the
+        range [start, end_old) replaced by wrappers[start:end_new].
+
+        Replacements in place and changes at the end are applied one by one
+        while they touch few keys, anything else is rebuilt.
+        """
+        at_end = end_old == len(self._keys) and end_new == len(wrappers)
+        if end_old != end_new and not at_end:
+            self.build(wrappers)
+            return
+
+        new_keys = [self._task_keys(wrapper) for wrapper in wrappers[start:end_new]]
+        touched = sum(len(keys) for task_keys in new_keys for keys in task_keys)
+        touched += sum(
+            len(keys) for task_keys in self._keys[start:end_old] for keys in task_keys
+        )
+        if end_old > end_new:
+            touched += self._truncate_cost()
+        if touched > self.SYNC_LIMIT:
+            self.build(wrappers)
+            return
+
+        replaced = min(end_old, end_new) - start
+        for offset, keys in enumerate(new_keys[:replaced]):
+            self._set_keys(start + offset, keys)
+        if end_old > end_new:
+            self.truncate(end_new)
+        for keys in new_keys[replaced:]:
+            self._keys.append((frozenset(),) * self.FIELDS)
+            self._set_keys(len(self._keys) - 1, keys)
+
+    def append(self, wrapper) -> None:
+        self._keys.append((frozenset(),) * self.FIELDS)
+        self.update(len(self._keys) - 1, wrapper)
+
+    def update(self, idx: int, wrapper) -> None:
+        self._set_keys(idx, self._task_keys(wrapper))
+
+    def _set_keys(self, idx: int, keys: tuple[frozenset, ...]) -> None:
+        bit = 1 << idx
+
+        for field, (old, new) in enumerate(zip(self._keys[idx], keys)):
+            index = self._index[field]
+            for key in old - new:
+                index[key] &= ~bit
+                if not index[key]:
+                    del index[key]
+                    self._key_removed(field, key)
+            for key in new - old:
+                if key not in index:
+                    index[key] = 0
+                    self._key_added(field, key)
+                index[key] |= bit
+
+        self._keys[idx] = keys
+
+    def delete(self, idx: int) -> None:
+        """Removes position idx, shifting every later position down by one."""
+        del self._keys[idx]
+
+        for field, index in enumerate(self._index):
+            for key in list(index):
+                index[key] = _drop_bit(index[key], idx)
+                if not index[key]:
+                    del index[key]
+                    self._key_removed(field, key)
+
+    def truncate(self, length: int) -> None:
+        """Removes every position from length on, with one pass over the keys."""
+        del self._keys[length:]
+
+        mask = (1 << length) - 1
+        for field, index in enumerate(self._index):
+            for key in list(index):
+                index[key] &= mask
+                if not index[key]:
+                    del index[key]
+                    self._key_removed(field, key)
+
+    def all(self) -> int:
+        return (1 << len(self._keys)) - 1
+
+    def get(self, field: int, key: str) -> int:
+        return self._index[field].get(key, 0)
+
+
+class TagIndex(BitsetIndex):
+    """+project / @context index used by filters."""
+
+    FIELDS = 2
+    PROJECTS = 0
+    CONTEXTS = 1
+
+    def _task_keys(self, wrapper) -> tuple[frozenset, ...]:
+        return (
+            frozenset(wrapper.get_projects() or ()),
+            frozenset(wrapper.get_contexts() or ()),
+        )
+
+    def match(self, projects, contexts) -> int:
+        bits = self.all()
+
+        for name in projects:
+            bits &= self.get(self.PROJECTS, name)
+        for name in contexts:
+            bits &= self.get(self.CONTEXTS, name)
+
+        return bits
+
+
+class SearchIndex(BitsetIndex):
+    """Word index over task descriptions with prefix lookups.
+
+    Words map to sorted arrays of task positions rather than bitsets: most
+    words are rare, and a bitset is as long as its highest position.
+    """
+
+    TOKEN_RE = re.compile(r"\w+")
+    EXACT_MATCH_BOOST = 2.0
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._vocabulary: list[str] = []
+
+    @classmethod
+    def tokenize(cls, text: str) -> list[str]:
+        return cls.TOKEN_RE.findall(text.lower())
+
+    def _task_keys(self, wrapper) -> tuple[frozenset, ...]:
+        return (frozenset(self.tokenize(wrapper.get_bare_description())),)
+
+    def _entry(self, positions: list[int]) -> array:
+        return array("I", positions)
+
+    def _truncate_cost(self) -> int:
+        # Positions are cut off the end of each array.
+        return 0
+
+    def _key_added(self, field: int, key: str) -> None:
+        bisect.insort(self._vocabulary, key)
+
+    def _keys_built(self, field: int, keys) -> None:
+        self._vocabulary = sorted(keys)
+
+    def _key_removed(self, field: int, key: str) -> None:
+        idx = bisect.bisect_left(self._vocabulary, key)
+        if idx < len(self._vocabulary) and self._vocabulary[idx] == key:
+            del self._vocabulary[idx]
+
+    def _set_keys(self, idx: int, keys: tuple[frozenset, ...]) -> None:
+        postings = self._index[0]
+        old, new = self._keys[idx][0], keys[0]
+
+        for key in old - new:
+            positions = postings[key]
+            del positions[bisect.bisect_left(positions, idx)]
+            if not positions:
+                del postings[key]
+                self._key_removed(0, key)
+        for key in new - old:
+            if key not in postings:
+                postings[key] = array("I")
+                self._key_added(0, key)
+            bisect.insort(postings[key], idx)
+
+        self._keys[idx] = keys
+
+    def delete(self, idx: int) -> None:
+        """Removes position idx, shifting every later position down by one."""
+        del self._keys[idx]
+
+        postings = self._index[0]
+        for key in list(postings):
+            positions = postings[key]
+            if positions[-1] < idx:
+                continue
+
+            start = bisect.bisect_left(positions, idx)
+            if positions[start] == idx:
+                del positions[start]
+            for i in range(start, len(positions)):
+                positions[i] -= 1
+            if not positions:
+                del postings[key]
+                self._key_removed(0, key)
+
+    def truncate(self, length: int) -> None:
+        del self._keys[length:]
+
+        postings = self._index[0]
+        for key in list(postings):
+            positions = postings[key]
+            del positions[bisect.bisect_left(positions, length) :]
+            if not positions:
+                del postings[key]
+                self._key_removed(0, key)
+
+    def get(self, field: int, key: str) -> int:
+        return bits_of(self._index[field].get(key, ()))
+
+    def _prefix_postings(self, prefix: str) -> list[array]:
+        postings = []
+        idx = bisect.bisect_left(self._vocabulary, prefix)
+        while idx < len(self._vocabulary) and self._vocabulary[idx].startswith(
+            prefix
+        ):
+            postings.append(self._index[0][self._vocabulary[idx]])
+            idx += 1
+
+        return postings
+
+    def _prefix_bits(self, prefix: str) -> int:
+        postings = self._prefix_postings(prefix)
+        if len(postings) == 1:
+            return bits_of(postings[0])
+
+        return bits_of(sorted(set(chain.from_iterable(postings))))
+
+    def match(self, query: str) -> int:
+        """Bitset of tasks containing every query word (as a word prefix)."""
+        bits = self.all()
+        for term in self.tokenize(query):
+            bits &= self._prefix_bits(term)
+
+        return bits
+
+    def search(self, query: str, candidates: int | None = None) -> list[int]:
+        """Positions of tasks containing every query word (as a word prefix).
+
+        Results are ranked by the summed inverse document frequency of the
+        matched words, exact word matches counting more than prefix ones.
+        """
+        terms = list(dict.fromkeys(self.tokenize(query)))
+        if not terms:
+            return []
+
+        bits = self.all() if candidates is None else candidates
+        weighted = []
+        for term in terms:
+            prefix_bits = self._prefix_bits(term)
+            bits &= prefix_bits
+            if not bits:
+                return []
+
+            weight = math.log(1 + len(self) / prefix_bits.bit_count())
+            weighted.append((weight, frozenset(self._index[0].get(term, ()))))
+
+        def _score(idx):
+            return sum(
+                weight * (self.EXACT_MATCH_BOOST if idx in exact else 1.0)
+                for weight, exact in weighted
+            )
+
+        return sorted(iter_bits(bits), key=lambda idx: (-_score(idx), idx))
+
+
+def _date_key(value) -> frozenset:
+    return frozenset() if value is None else frozenset([value.toordinal()])
+
+
+class FieldIndex(BitsetIndex):
+    """Typed task fields: attributes, priority, dates and completion state.
+
+    Date fields are keyed by ordinal and keep a sorted list of the known
+    dates so that ranges only visit dates that actually occur.
+    """
+
+    FIELDS = 7
+    ATTRIBUTE_KEYS = 0
+    ATTRIBUTES = 1
+    PRIORITY = 2
+    DUE = 3
+    CREATED = 4
+    COMPLETED = 5
+    STATE = 6
+
+    DATE_FIELDS = (DUE, CREATED, COMPLETED)
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._dates: dict[int, list[int]] = {field: [] for field in self.DATE_FIELDS}
+
+    def _task_keys(self, wrapper) -> tuple[frozenset, ...]:
+        attributes = wrapper.get_all_attributes() or {}
+        priority = wrapper.get_priority()
+
+        return (
+            frozenset(attributes),
+            frozenset(
+                f"{key}:{value}" for key, values in attributes.items() for value in values
+            ),
+            frozenset() if priority is None else frozenset([priority]),
+            _date_key(wrapper.get_due_date()),
+            _date_key(wrapper.get_creation_date()),
+            _date_key(wrapper.get_completion_date()),
+            frozenset(["done" if wrapper.is_completed else "open"]),
+        )
+
+    def _key_added(self, field: int, key) -> None:
+        if field in self._dates:
+            bisect.insort(self._dates[field], key)
+
+    def _keys_built(self, field: int, keys) -> None:
+        if field in self._dates:
+            self._dates[field] = sorted(keys)
+
+    def _key_removed(self, field: int, key) -> None:
+        if field not in self._dates:
+            return
+
+        dates = self._dates[field]
+        idx = bisect.bisect_left(dates, key)
+        if idx < len(dates) and dates[idx] == key:
+            del dates[idx]
+
+    def any(self, field: int) -> int:
+        bits = 0
+        for value in self._index[field].values():
+            bits |= value
+
+        return bits
+
+    def range(self, field: int, low=None, high=None) -> int:
+        """Bitset of tasks whose date field is within [low, high]."""
+        dates = self._dates[field]
+        start = 0 if low is None else bisect.bisect_left(dates, low.toordinal())
+        end = len(dates) if high is None else bisect.bisect_right(dates, high.toordinal())
+
+        bits = 0
+        for ordinal in dates[start:end]:
+            bits |= self.get(field, ordinal)
+
+        return bits
@@ -0,0 +1,133 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HasherBusy(RuntimeError):
+    pass
+
+
+class HashMetrics:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._stats: dict[str, dict] = {}
+
+    def _entry(self, operation: str) -> dict:
+        return self._stats.setdefault(
+            operation,
+            {
+                "calls": 0,
+                "rejected": 0,
+                "total_latency": 0.0,
+                "max_latency": 0.0,
+                "total_wait": 0.0,
+            },
+        )
+
+    def record(self, operation: str, latency: float, wait: float) -> None:
+        with self._lock:
+            stats = self._entry(operation)
+            stats["calls"] += 1
+            stats["total_latency"] += latency
+            stats["max_latency"] = max(stats["max_latency"], latency)
+            stats["total_wait"] += wait
+
+    def record_rejected(self, operation: str) -> None:
+        with self._lock:
+            self._entry(operation)["rejected"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {operation: dict(stats) for operation, stats in self._stats.items()}
+
+
+hash_metrics = HashMetrics()
+
+
+class PasswordHasher:
+    """Runs password hashing on a small bounded pool.
+
+    At most max_workers hashes run at once and max_queue more may wait;
+    further requests fail at once with HasherBusy instead of piling up
+    CPU and memory hungry work on every request thread.
+    """
+
+    DEFAULT_MAX_WORKERS = 2
+    DEFAULT_MAX_QUEUE = 16
+    DEFAULT_TIMEOUT = 10.0
+    DEFAULT_METHOD = "scrypt"
+
+    def __init__(self) -> None:
+        self._executor = None
+        self._prefix = None
+        self._lock = threading.Lock()
+        self.configure()
+
+    def configure(
+        self,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        method: str = DEFAULT_METHOD,
+        timeout: float = DEFAULT_TIMEOUT,
+    ) -> None:
+        with self._lock:
+            old = self._executor
+            self._executor = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="password-hash"
+            )
+            self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+            self._method = method
+            self._timeout = timeout
+            self._prefix = None
+
+        if old is not None:
+            old.shutdown(wait=False)
+
+    def _run(self, operation: str, fn, *args):
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            hash_metrics.record_rejected(operation)
+            raise HasherBusy("Too many password operations in progress.")
+
+        submitted = time.monotonic()
+
+        def task():
+            started = time.monotonic()
+            try:
+                return fn(*args)
+            finally:
+                finished = time.monotonic()
+                hash_metrics.record(operation, finished - started, started - submitted)
+
+        try:
+            future = self._executor.submit(task)
+        except:
+            slots.release()
+            raise
+
+        future.add_done_callback(lambda _: slots.release())
+
+        try:
+            return future.result(timeout=self._timeout)
+        except TimeoutError:
+            raise HasherBusy("Password operation timed out.")
+
+    def check(self, pwhash: str, password: str) -> bool:
+        if not pwhash:
+            return False
+
+        return self._run("check", check_password_hash, pwhash, password)
+
+    def generate(self, password: str) -> str:
+        return self._run("generate", generate_password_hash, password, self._method)
+
+    def needs_rehash(self, pwhash: str) -> bool:
+        """True if pwhash was made with other parameters than the current ones."""
+        if self._prefix is None:
+            self._prefix = self.generate("").split("$", 1)[0]
+
+        return pwhash.split("$", 1)[0] != self._prefix
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,172 @@
+from datetime import date, timedelta
+from .index import FieldIndex, SearchIndex, TagIndex
+
+
+class QueryError(ValueError):
+    pass
+
+
+def _parse_date(text: str) -> date:
+    text = text.strip().lower()
+
+    if text.startswith("today"):
+        offset = text[len("today") :]
+        try:
+            return date.today() + timedelta(days=int(offset or 0))
+        except ValueError:
+            raise QueryError(f"Invalid date offset '{text}'.")
+
+    try:
+        return date.fromisoformat(text)
+    except ValueError:
+        raise QueryError(f"Invalid date '{text}', expected YYYY-MM-DD or today[+-N].")
+
+
+def _parse_date_range(value: str) -> tuple[date | None, date | None]:
+    """Accepts DATE, <DATE, <=DATE, >DATE, >=DATE and DATE..DATE."""
+    if ".." in value:
+        low, high = value.split("..", 1)
+        return (
+            _parse_date(low) if low else None,
+            _parse_date(high) if high else None,
+        )
+
+    for op in ("<=", ">=", "<", ">"):
+        if value.startswith(op):
+            bound = _parse_date(value[len(op) :])
+            if op == "<":
+                return (None, bound - timedelta(days=1))
+            if op == "<=":
+                return (None, bound)
+            if op == ">":
+                return (bound + timedelta(days=1), None)
+            return (bound, None)
+
+    day = _parse_date(value)
+    return (day, day)
+
+
+def _parse_priority_range(value: str) -> list[str]:
+    value = value.upper()
+    low, sep, high = value.partition("..")
+    if not sep:
+        high = low
+
+    if not (len(low) == len(high) == 1 and low.isalpha() and high.isalpha()):
+        raise QueryError(f"Invalid priority '{value}', expected A or A..C.")
+
+    low, high = sorted((low, high))
+    return [chr(c) for c in range(ord(low), ord(high) + 1)]
+
+
+class Query:
+    """Compiled filter query, see compile_query for the syntax.
+
+    Every term narrows the result, terms prefixed with "-" exclude.
+    """
+
+    DATE_KEYS = {
+        "due": FieldIndex.DUE,
+        "created": FieldIndex.CREATED,
+        "done": FieldIndex.COMPLETED,
+    }
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.words: list[str] = []
+        self._plan: list[tuple[bool, str, tuple]] = []
+
+        tokens = [t.strip() for t in text.replace(",", " ").split() if t.strip()]
+        for token in tokens:
+            self._compile_token(token)
+
+    def __bool__(self) -> bool:
+        return bool(self._plan)
+
+    def _compile_token(self, token: str) -> None:
+        negate = token.startswith("-") and len(token) > 1
+        if negate:
+            token = token[1:]
+
+        if token.startswith("+") and len(token) > 1:
+            self._plan.append((negate, "tag", (TagIndex.PROJECTS, token[1:])))
+            return
+
+        if token.startswith("@") and len(token) > 1:
+            self._plan.append((negate, "tag", (TagIndex.CONTEXTS, token[1:])))
+            return
+
+        key, sep, value = token.partition(":")
+        if not sep or not key or not value:
+            if not negate:
+                self.words.append(token)
+            self._plan.append((negate, "word", (token,)))
+            return
+
+        if key == "pri":
+            if value == "*":
+                self._plan.append((negate, "any", (FieldIndex.PRIORITY,)))
+            else:
+                priorities = _parse_priority_range(value)
+                self._plan.append((negate, "keys", (FieldIndex.PRIORITY, priorities)))
+            return
+
+        if key in self.DATE_KEYS:
+            field = self.DATE_KEYS[key]
+            if value == "*":
+                self._plan.append((negate, "any", (field,)))
+            else:
+                self._plan.append((negate, "range", (field, *_parse_date_range(value))))
+            return
+
+        if key == "is":
+            if value not in ("done", "open"):
+                raise QueryError(f"Invalid state '{value}', expected done or open.")
+            self._plan.append((negate, "keys", (FieldIndex.STATE, [value])))
+            return
+
+        if value == "*":
+            self._plan.append((negate, "keys", (FieldIndex.ATTRIBUTE_KEYS, [key])))
+        else:
+            self._plan.append((negate, "keys", (FieldIndex.ATTRIBUTES, [token])))
+
+    def match(self, tags: TagIndex, fields: FieldIndex, search: SearchIndex) -> int:
+        everything = tags.all()
+        bits = everything
+
+        for negate, kind, args in self._plan:
+            if kind == "tag":
+                term = tags.get(*args)
+            elif kind == "word":
+                term = search.match(*args)
+            elif kind == "any":
+                term = fields.any(*args)
+            elif kind == "range":
+                term = fields.range(*args)
+            else:
+                field, keys = args
+                term = 0
+                for key in keys:
+                    term |= fields.get(field, key)
+
+            bits &= (everything & ~term) if negate else term
+            if not bits:
+                break
+
+        return bits
+
+
+def compile_query(text: str) -> Query:
+    """Compiles a filter query.
+
+    Supported terms, separated by spaces or commas:
+      +project, @context   task has the tag
+      word                 description contains a word starting with it
+      pri:A, pri:A..C      priority (pri:* for any)
+      due:, created:,      dates: 2026-11-01, <2026-11-01, >=today,
+      done:                today+7, 2026-01-01..2026-02-01 (* for any)
+      is:done, is:open     completion state
+      key:value, key:*     task attribute
+    Prefix any term with "-" to exclude matching tasks.
+    """
+    return Query(text or "")
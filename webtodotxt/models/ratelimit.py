@@ -0,0 +1,164 @@
+import os
+import sqlite3
+import threading
+import time
+from limits.storage import Storage
+from limits.storage.base import SlidingWindowCounterSupport, TimestampedSlidingWindow
+from math import floor
+from urllib.parse import urlparse
+
+
+class SQLiteStorage(Storage, SlidingWindowCounterSupport, TimestampedSlidingWindow):
+    """Rate limit counters in a local SQLite database (WAL mode).
+
+    Shared by every worker process on the host without an outside service:
+    sqlite:///path/to/limits.sqlite, or sqlite://limits.sqlite relative to
+    the working directory. Supports the fixed-window and
+    sliding-window-counter strategies.
+    """
+
+    STORAGE_SCHEME = ["sqlite"]
+    PURGE_EVERY = 1000
+    BUSY_TIMEOUT_MS = 5000
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, **options) -> None:
+        parsed = urlparse(uri)
+        # An empty path would give every connection its own temporary database.
+        self._path = parsed.netloc + parsed.path
+        if not self._path:
+            raise ValueError(f"No database path in rate limit storage URI {uri!r}.")
+        self._local = threading.local()
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS counters ("
+                "key TEXT PRIMARY KEY, value INTEGER NOT NULL, expiry REAL NOT NULL)"
+            )
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread and process, sqlite handles don't survive fork.
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self._path, isolation_level=None, timeout=30)
+        conn.execute(f"PRAGMA busy_timeout = {self.BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        self._local.writes = 0
+        return conn
+
+    def _incr(self, conn: sqlite3.Connection, key: str, expiry: float, amount: int) -> int:
+        now = time.time()
+        self._local.writes += 1
+        if self._local.writes % self.PURGE_EVERY == 0:
+            conn.execute("DELETE FROM counters WHERE expiry <= ?", (now,))
+
+        row = conn.execute(
+            "INSERT INTO counters (key, value, expiry) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET "
+            "value = CASE WHEN expiry <= ? THEN excluded.value "
+            "ELSE value + excluded.value END, "
+            "expiry = CASE WHEN expiry <= ? THEN excluded.expiry ELSE expiry END "
+            "RETURNING value",
+            (key, amount, now + expiry, now, now),
+        ).fetchone()
+        return row[0]
+
+    def _get(self, conn: sqlite3.Connection, key: str, now: float) -> int:
+        row = conn.execute(
+            "SELECT value FROM counters WHERE key = ? AND expiry > ?", (key, now)
+        ).fetchone()
+        return 0 if row is None else row[0]
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        return self._incr(self._connection(), key, expiry, amount)
+
+    def decr(self, key: str, amount: int = 1) -> int:
+        conn = self._connection()
+        conn.execute(
+            "UPDATE counters SET value = MAX(value - ?, 0) WHERE key = ?", (amount, key)
+        )
+        return self._get(conn, key, time.time())
+
+    def get(self, key: str) -> int:
+        return self._get(self._connection(), key, time.time())
+
+    def get_expiry(self, key: str) -> float:
+        row = self._connection().execute(
+            "SELECT expiry FROM counters WHERE key = ?", (key,)
+        ).fetchone()
+        return time.time() if row is None else row[0]
+
+    def check(self) -> bool:
+        try:
+            self._connection().execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self) -> int | None:
+        return self._connection().execute("DELETE FROM counters").rowcount
+
+    def clear(self, key: str) -> None:
+        self._connection().execute("DELETE FROM counters WHERE key = ?", (key,))
+
+    def _sliding_window_info(
+        self, conn: sqlite3.Connection, key: str, expiry: int, now: float
+    ) -> tuple[int, float, int, float]:
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        previous_count = self._get(conn, previous_key, now)
+        current_count = self._get(conn, current_key, now)
+
+        if previous_count == 0:
+            previous_ttl = 0.0
+        else:
+            previous_ttl = (1 - (((now - expiry) / expiry) % 1)) * expiry
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+
+        return previous_count, previous_ttl, current_count, current_ttl
+
+    def acquire_sliding_window_entry(
+        self, key: str, limit: int, expiry: int, amount: int = 1
+    ) -> bool:
+        if amount > limit:
+            return False
+
+        conn = self._connection()
+        # The write lock makes the check and the increment one step across
+        # processes, unlike the compare-and-revert of the memory storage.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            previous_count, previous_ttl, current_count, _ = self._sliding_window_info(
+                conn, key, expiry, now
+            )
+            weighted = previous_count * previous_ttl / expiry + current_count
+            acquired = floor(weighted) + amount <= limit
+            if acquired:
+                _, current_key = self.sliding_window_keys(key, expiry, now)
+                self._incr(conn, current_key, 2 * expiry, amount)
+            conn.execute("COMMIT")
+        except:
+            conn.execute("ROLLBACK")
+            raise
+
+        return acquired
+
+    def get_sliding_window(self, key: str, expiry: int) -> tuple[int, float, int, float]:
+        return self._sliding_window_info(self._connection(), key, expiry, time.time())
+
+    def clear_sliding_window(self, key: str, expiry: int) -> None:
+        for window_key in self.sliding_window_keys(key, expiry, time.time()):
+            self.clear(window_key)
@@ -1,12 +1,96 @@
+import bisect
+import copy
+import hashlib
+import threading
+from collections import deque
+from contextlib import contextmanager
+from collections.abc import Mapping
+from types import MappingProxyType
 from pytodotxt import Task, TodoTxt
-from .file import DbFile
+from .file import DbFile, detect_linesep
+from .index import FieldIndex, SearchIndex, TagIndex, iter_bits
+from .query import Query
 from datetime import datetime, date, datetime, timedelta
 from dateutil.relativedelta import relativedelta
 
 
+def check_single_line(line: str) -> str:
+    """Returns line, ValueError if it would be written as several lines."""
+    if "\n" in line or "\r" in line:
+        raise ValueError("Task must be a single line.")
+
+    return line
+
+
 class TaskWrapper:
+    """Task plus its typed fields, computed once per (re)parse of the line."""
+
+    __slots__ = (
+        "_task",
+        "_priority",
+        "_due_date",
+        "_creation_date",
+        "_completion_date",
+        "_projects",
+        "_contexts",
+        "_bare_description",
+        "_all_attributes",
+        "_attributes",
+        "_sort_key",
+        "_completion_sort_key",
+        "_id",
+        "_changed",
+    )
+
     def __init__(self, task: Task):
         self._task = task
+        self._id = None
+        self._refresh()
+        self._changed = False
+
+    def _refresh(self):
+        task = self._task
+        # Unchanged tasks are written back as read, not re-serialized.
+        self._changed = True
+        attributes = task.attributes or {}
+
+        if task.priority is not None:
+            self._priority = task.priority[0]
+        elif attributes.get("pri", None) is not None:
+            self._priority = attributes["pri"][0]
+        else:
+            self._priority = None
+
+        self._due_date = None
+        if attributes.get("due", None) is not None:
+            try:
+                self._due_date = Task.parse_date(attributes["due"][0])
+            except ValueError:
+                pass
+
+        self._creation_date = task.creation_date
+        self._completion_date = task.completion_date
+        self._projects = tuple(task.projects)
+        self._contexts = tuple(task.contexts)
+        self._bare_description = task.bare_description()
+
+        self._all_attributes = MappingProxyType(
+            {key: tuple(values) for key, values in attributes.items()}
+        )
+        self._attributes = MappingProxyType(
+            {key: values for key, values in self._all_attributes.items() if key != "due"}
+        )
+
+        created = self._creation_date
+        self._sort_key = (
+            "Z" if self._priority is None else self._priority,
+            -created.toordinal() if isinstance(created, date) else float("-inf"),
+        )
+
+        completed = self._completion_date
+        self._completion_sort_key = (
+            -completed.toordinal() if completed else float("-inf")
+        )
 
     def toggle_done(self) -> None | Task:
         if self._task.is_completed:
@@ -23,6 +107,7 @@ class TaskWrapper:
         self._task.completion_date = None
         if self._task.attributes.get("pri", None) is not None:
             self._task.priority = self._task.attributes.get("pri")[0]
+        self._refresh()
 
     def set_done(self) -> None | Task:
         if self._task.is_completed:
@@ -37,58 +122,65 @@ class TaskWrapper:
             self._task.add_attribute("pri", self._task.priority)
         self._task.is_completed = True
         self._task.completion_date = date.today()
+        self._refresh()
 
         return new_task
 
     def get_creation_date(self):
-        return self._task.creation_date
+        return self._creation_date
 
     def get_completion_date(self):
-        return self._task.completion_date
+        return self._completion_date
 
     def get_contexts(self):
-        return self._task.contexts
+        return self._contexts
 
     def get_projects(self):
-        return self._task.projects
+        return self._projects
 
-    def get_attributes(self):
-        if self._task.attributes is None:
-            return None
+    def get_all_attributes(self) -> Mapping[str, tuple[str, ...]]:
+        return self._all_attributes
 
-        attrs = self._task.attributes
-
-        if "due" in attrs:
-            del attrs["due"]
-        return attrs
+    def get_attributes(self) -> Mapping[str, tuple[str, ...]]:
+        """Read-only attributes without "due", shared by every caller."""
+        return self._attributes
 
     def get_priority(self):
-        if self._task.priority is not None:
-            return self._task.priority[0]
-
-        return (
-            None
-            if self._task.attributes.get("pri", None) is None
-            else self._task.attributes.get("pri")[0]
-        )
+        return self._priority
 
     def get_bare_description(self):
-        return self._task.bare_description()
+        return self._bare_description
 
     def get_line_nr(self):
         return self._task.linenr
 
+    def get_line(self) -> str:
+        return self._task.serialize()
+
+    def get_id(self) -> str | None:
+        """Stable id assigned by Todos, derived from the line as last saved."""
+        return self._id
+
+    def snapshot(self) -> "TaskWrapper":
+        """Copy unaffected by later changes, for use outside Todos.lock."""
+        clone = copy.copy(self)
+        clone._task = copy.copy(self._task)
+        return clone
+
     def get_due_date(self):
-        if not self._is_due():
-            return None
+        return self._due_date
 
-        try:
-            return Task.parse_date(self._task.attributes.get("due")[0])
-        except ValueError:
-            return None
+    def get_sort_key(self):
+        """Priority first (none last), then newest creation date."""
+        return self._sort_key
+
+    def get_completion_sort_key(self):
+        """Most recently completed first."""
+        return self._completion_sort_key
 
     def parse(self, line):
-        self._task.parse(line)
+        self._task.parse(check_single_line(line))
+        self._refresh()
 
     @property
     def is_completed(self):
@@ -142,19 +234,174 @@ class TaskWrapper:
         return dt
 
     def edit_line(self, new_value):
-        self._task.parse(new_value)
+        self.parse(new_value)
+
+
+def line_id(line: str) -> str:
+    return hashlib.blake2b(line.encode(), digest_size=8).hexdigest()
 
 
 class Todos:
+    """Parsed todo file.
+
+    Tasks are addressed by list position, by file line number or by id: a
+    hash of the task line (suffixed for duplicate lines) which stays valid
+    while the line is unchanged, wherever it moves in the file.
+
+    Todos are shared between request threads: reads of tasks and indexes
+    must hold lock, which every method changing them takes before the
+    file lock.
+    """
+
+    # Rough memory of a parsed task, measured on typical todo.txt lines.
+    APPROX_TASK_BYTES = 4096
+    APPROX_BYTES_PER_LINE_BYTE = 24
+
     def __init__(self, db_file: DbFile):
         self.db_file = db_file
-
         self.todotxt = TodoTxt(self.db_file.get_path())
-        self.todotxt.parse()
+        self._tags = TagIndex()
+        self._search = SearchIndex()
+        self._fields = FieldIndex()
+        self._indexes = (self._tags, self._search, self._fields)
+        self.lock = threading.RLock()
+        self._parse()
+
+    def _parse(self):
+        self.todotxt.tasks = []
+        self._wrappers = []
+        self._task_lines = []
+        self._task_offsets = []
+        self._ids: dict[str, int] = {}
+        self._duplicates: dict[str, int] = {}
+        self.reload()
+
+    def get_stat_key(self) -> tuple | None:
+        return self._stat_key
+
+    def approx_size(self) -> int:
+        """Estimated memory taken by the parsed tasks and their indexes."""
+        file_size = 0 if self._stat_key is None else self._stat_key[1]
+        return (
+            len(self._wrappers) * self.APPROX_TASK_BYTES
+            + file_size * self.APPROX_BYTES_PER_LINE_BYTE
+        )
+
+    def refresh(self) -> None:
+        """Reloads the file if it changed since it was last read or written."""
+        with self.lock:
+            if self.db_file.stat_key() != self._stat_key:
+                self.reload()
+
+    def reload(self, incremental: bool = True):
+        """Re-read the file, reusing parsed tasks whose line did not change."""
+        with self.lock:
+            self._reload(incremental)
+
+    def _reload(self, incremental: bool):
+        if not incremental:
+            self._parse()
+            return
+
+        with self.db_file.shared_lock():
+            self._stat_key = self.db_file.stat_key()
+            lines = self._read_lines()
+
+        previous: dict[str, deque] = {}
+        for line, task, wrapper in zip(
+            self._task_lines, self.todotxt.tasks, self._wrappers
+        ):
+            previous.setdefault(line, deque()).append((task, wrapper))
+
+        tasks, wrappers, task_lines, task_offsets = [], [], [], []
+        for linenr, (offset, line) in enumerate(lines):
+            if len(line.strip()) == 0:
+                continue
+
+            reused = previous.get(line, None)
+            if reused and not reused[0][1]._changed:
+                task, wrapper = reused.popleft()
+                task.linenr = linenr
+            else:
+                task = Task(line, linenr, self.todotxt, self.todotxt.serializer)
+                wrapper = TaskWrapper(task)
+
+            tasks.append(task)
+            wrappers.append(wrapper)
+            task_lines.append(line)
+            task_offsets.append(offset)
+
+        old_wrappers = self._wrappers
+        self.todotxt.tasks = tasks
+        self._wrappers = wrappers
+        self._task_lines = task_lines
+        self._task_offsets = task_offsets
+        self._rebuild_ids()
+        self._sync_indexes(old_wrappers, wrappers)
+
+    def _sync_indexes(self, old: list, new: list) -> None:
+        """Brings the indexes from old to new, see BitsetIndex.sync."""
+        start = 0
+        common = min(len(old), len(new))
+        while start < common and old[start] is new[start]:
+            start += 1
+        end_old, end_new = len(old), len(new)
+        while (
+            end_old > start and end_new > start and old[end_old - 1] is new[end_new - 1]
+        ):
+            end_old -= 1
+            end_new -= 1
+
+        for index in self._indexes:
+            index.sync(new, start, end_old, end_new)
+
+    def _assign_id(self, idx: int, line: str) -> None:
+        base = line_id(line)
+        task_id = base
+        # Suffixes already taken by duplicates of the line are skipped.
+        n = self._duplicates.get(base, 1)
+        while task_id in self._ids:
+            task_id = f"{base}-{n}"
+            n += 1
+
+        if task_id != base:
+            self._duplicates[base] = n
+        self._wrappers[idx]._id = task_id
+        self._ids[task_id] = idx
+
+    def _drop_id(self, idx: int) -> None:
+        task_id = self._wrappers[idx]._id
+        if self._ids.get(task_id, None) == idx:
+            del self._ids[task_id]
+
+    def _rebuild_ids(self) -> None:
+        self._ids = {}
+        self._duplicates = {}
+        for idx, line in enumerate(self._task_lines):
+            if line is not None:
+                self._assign_id(idx, line)
+
+    def _read_lines(self) -> list[tuple[int, str]]:
+        """Returns (byte offset, text) of every line in the file."""
+        with open(self.db_file.get_path(), "rb") as f:
+            data = f.read()
+
+        # Lines are split on any line break, the file may mix them after
+        # appends from other tools; saves write the detected one.
+        self.todotxt.linesep = detect_linesep(data)
+        encoding = self.todotxt.encoding
+
+        lines = []
+        offset = 0
+        for raw in data.splitlines(keepends=True):
+            lines.append((offset, raw.rstrip(b"\r\n").decode(encoding)))
+            offset += len(raw)
+
+        return lines
 
     def get_task(self, line_number: int) -> TaskWrapper | None:
         try:
-            return TaskWrapper(self.todotxt.tasks[line_number])
+            return self._wrappers[line_number]
         except IndexError:
             return None
 
@@ -165,29 +412,246 @@ class Todos:
             return None
 
     def get_tasks(self):
-        return [TaskWrapper(task) for task in self.todotxt.tasks]
+        return list(self._wrappers)
+
+    def get_position(self, task_id: str) -> int | None:
+        """List position of the task with the given id, see get_task."""
+        return self._ids.get(task_id, None)
+
+    def get_task_by_id(self, task_id: str) -> TaskWrapper | None:
+        idx = self._ids.get(task_id, None)
+        return None if idx is None else self._wrappers[idx]
+
+    def query_tasks(self, query: Query, ranked: bool = False) -> list[TaskWrapper]:
+        """Tasks matching query, in file order or best search match first."""
+        if not query:
+            return self.get_tasks()
+
+        bits = query.match(self._tags, self._fields, self._search)
+
+        if ranked and query.words:
+            positions = self._search.search(" ".join(query.words), bits)
+        else:
+            positions = iter_bits(bits)
+
+        return [self._wrappers[idx] for idx in positions]
 
     def save(self):
-        self.todotxt.save()
+        with self.lock, self.db_file.exclusive_lock():
+            self._save()
+
+    def _save(self):
+        order = sorted(range(len(self.todotxt.tasks)), key=self._linenr_of)
+        tasks = [self.todotxt.tasks[idx] for idx in order]
+        wrappers = [self._wrappers[idx] for idx in order]
+        lines = [self._line_of(idx) for idx in order]
+
+        offsets = self._write_lines(lines)
+
+        for wrapper in wrappers:
+            wrapper._changed = False
+
+        for linenr, task in enumerate(tasks):
+            task.linenr = linenr
+
+        self.todotxt.tasks = tasks
+        self._wrappers = wrappers
+        self._task_lines = lines
+        self._task_offsets = offsets
+        self._stat_key = self.db_file.stat_key()
+        self._rebuild_ids()
+
+        if order != list(range(len(order))):
+            for index in self._indexes:
+                index.build(wrappers)
+
+    def _line_of(self, idx: int) -> str:
+        line = self._task_lines[idx]
+        if line is None or self._wrappers[idx]._changed:
+            return self.todotxt.tasks[idx].serialize()
+
+        return line
+
+    def save_task(self, line_number: int):
+        """Write back a single modified task, rewriting only the file tail."""
+        with self.lock, self.db_file.exclusive_lock():
+            self._save_task(line_number)
+
+    def _save_task(self, line_number: int):
+        for index in self._indexes:
+            index.update(line_number, self._wrappers[line_number])
+
+        line = self.todotxt.tasks[line_number].serialize()
+        old_line = self._task_lines[line_number]
+        in_sync = self.db_file.stat_key() == self._stat_key
+
+        if old_line is None:
+            self.save()
+            return
+
+        encoding = self.todotxt.encoding
+        old_data = old_line.encode(encoding)
+        new_data = line.encode(encoding)
+        offset = self._task_offsets[line_number]
+
+        # The old line is checked in place, so a file changed behind our
+        # back is still patched as long as the line didn't move.
+        if not self.db_file.replace_range(offset, old_data, new_data):
+            if not in_sync:
+                raise RuntimeError("The todo file was changed by another program.")
+            self.save()
+            return
+
+        delta = len(new_data) - len(old_data)
+        if delta:
+            for idx in range(line_number + 1, len(self._task_offsets)):
+                if self._task_offsets[idx] is not None:
+                    self._task_offsets[idx] += delta
+
+        self._drop_id(line_number)
+        self._task_lines[line_number] = line
+        self._wrappers[line_number]._changed = False
+        self._assign_id(line_number, line)
+        if in_sync:
+            self._stat_key = self.db_file.stat_key()
+        else:
+            self.reload()
+
+    def _linenr_of(self, idx: int) -> int:
+        linenr = self.todotxt.tasks[idx].linenr
+        return len(self.todotxt.tasks) if linenr is None else linenr
+
+    def _write_lines(self, lines: list[str]) -> list[int]:
+        sep = self.todotxt.linesep.encode()
+        encoded = [line.encode(self.todotxt.encoding) for line in lines]
+
+        offsets = []
+        offset = 0
+        for data in encoded:
+            offsets.append(offset)
+            offset += len(data) + len(sep)
+
+        self.db_file.atomic_write(sep.join(encoded) + sep if encoded else b"")
+
+        return offsets
+
+    def append_task(self, new_task: Task) -> TaskWrapper:
+        check_single_line(new_task.serialize())
+        last = self.todotxt.tasks[-1] if self.todotxt.tasks else None
 
-    def append_task(self, new_task: Task):
         self.todotxt.add(new_task)
+        self._wrappers.append(TaskWrapper(new_task))
+        for index in self._indexes:
+            index.append(self._wrappers[-1])
+        self._task_lines.append(None)
+        self._task_offsets.append(None)
+
+        if last is not None and last.linenr is not None:
+            new_task.linenr = last.linenr + 1
+
+        return self._wrappers[-1]
+
+    def append_and_save(self, new_task: Task):
+        """Append a single line to the file instead of rewriting it."""
+        with self.lock, self.db_file.exclusive_lock():
+            self._append_and_save(new_task)
+
+    def _append_and_save(self, new_task: Task):
+        new_task.serializer = self.todotxt.serializer
+        line = check_single_line(new_task.serialize())
+        in_sync = self.db_file.stat_key() == self._stat_key
+
+        offset = self.db_file.append_line(
+            line, self.todotxt.linesep, self.todotxt.encoding
+        )
+
+        if not in_sync:
+            self.reload()
+            return
+
+        self.append_task(new_task)
+        self._task_lines[-1] = line
+        self._task_offsets[-1] = offset
+        self._assign_id(len(self._wrappers) - 1, line)
+        self._stat_key = self.db_file.stat_key()
 
     def delete_task(self, line_number):
-        with open(self.db_file.get_path(), "r") as f:
-            lines = f.readlines()
+        with self.lock, self.db_file.exclusive_lock():
+            return self._delete_task(line_number)
 
-        if line_number < 0 or line_number >= len(lines):
-            return False
+    def _position_of(self, line_number: int) -> int | None:
+        linenrs = [self._linenr_of(idx) for idx in range(len(self.todotxt.tasks))]
+        idx = bisect.bisect_left(linenrs, line_number)
+        if idx >= len(linenrs) or linenrs[idx] != line_number:
+            return None
+
+        return idx
+
+    def find_task(self, line_number: int) -> TaskWrapper | None:
+        """Task at the given file line number (not list position)."""
+        idx = self._position_of(line_number)
+        return None if idx is None else self._wrappers[idx]
 
-        del lines[line_number]
+    def _delete_task(self, line_number):
+        if self.db_file.stat_key() != self._stat_key:
+            self.reload()
 
-        self.db_file.backup()
+        idx = self._position_of(line_number)
+        if idx is None:
+            return False
+
+        del self.todotxt.tasks[idx]
+        del self._wrappers[idx]
+        del self._task_lines[idx]
+        del self._task_offsets[idx]
+        for index in self._indexes:
+            index.delete(idx)
 
         try:
-            with open(self.db_file.get_path(), "w") as f:
-                f.writelines(lines)
+            self.save()
         except:
-            self.db_file.restore()
+            self.reload(incremental=False)
             raise
         return True
+
+    @contextmanager
+    def batch(self):
+        """Exclusive lock for several in-memory changes written by one save.
+
+        Inside the block tasks may be modified through their wrappers, added
+        with append_task and dropped with remove_task; indexes are rebuilt
+        once on exit. Any error discards every change of the batch.
+        """
+        with self.lock, self.db_file.exclusive_lock():
+            if self.db_file.stat_key() != self._stat_key:
+                self.reload()
+
+            try:
+                yield self
+                self._save()
+            except:
+                self.reload(incremental=False)
+                raise
+
+            for index in self._indexes:
+                index.build(self._wrappers)
+
+    def remove_task(self, wrapper: TaskWrapper) -> bool:
+        """Drops a task in memory only, see batch.
+
+        Positions of the remaining ids are stale until the batch is saved.
+        """
+        for idx, candidate in enumerate(self._wrappers):
+            if candidate is wrapper:
+                break
+        else:
+            return False
+
+        self._ids.pop(wrapper.get_id(), None)
+        wrapper._id = None
+
+        del self.todotxt.tasks[idx]
+        del self._wrappers[idx]
+        del self._task_lines[idx]
+        del self._task_offsets[idx]
+        return True
@@ -1,69 +1,145 @@
 import os
+import copy
+import threading
 import tomllib
 import tomli_w
 import flask_login
+from contextlib import contextmanager
 from .file import DbFile
-from werkzeug.security import check_password_hash, generate_password_hash
+from .password import HasherBusy, password_hasher
 
 
 class Config:
+    """config.toml of a user, shared by every worker.
+
+    Reads re-check the file stat and reload it when another process changed
+    it. Setters are read-modify-write cycles under the file lock; group
+    several of them in transaction() to write the file once.
+    """
+
     CONFIG_FILE_NAME = "config.toml"
+    DEFAULTS = {
+        "user": {
+            "username": "",
+            "full_name": "",
+            "password_hash": "",
+        },
+    }
 
     def __init__(self, db_file) -> None:
         self._db_file = DbFile(os.path.join(db_file, Config.CONFIG_FILE_NAME))
+        self._local = threading.local()
+        self._stat_key = None
         self._data = self._load()
 
-        if self._data.get("user", None) is None:
-            self._data["user"] = {
-                "username": "",
-                "full_name": "",
-                "password_hash": "",
-            }
-            self._save()
-
-        self._base_config = self._data["user"]
+        missing = [section for section in self.DEFAULTS if section not in self._data]
+        if missing:
+            with self.transaction():
+                for section in missing:
+                    self._data[section] = copy.deepcopy(self.DEFAULTS[section])
 
     def _load(self) -> dict:
         if not self._db_file.exists():
             raise FileNotFoundError(f"Missing config: {self._db_file.get_path()}")
-        with open(self._db_file.get_path(), "rb") as f:
-            return tomllib.load(f)
+
+        with self._db_file.shared_lock():
+            self._stat_key = self._db_file.stat_key()
+            with open(self._db_file.get_path(), "rb") as f:
+                return tomllib.load(f)
 
     def _save(self) -> None:
-        with open(self._db_file.get_path(), "wb") as f:
-            tomli_w.dump(self._data, f)
+        self._db_file.atomic_write(tomli_w.dumps(self._data).encode())
+        self._stat_key = self._db_file.stat_key()
+
+    def _fresh(self) -> dict:
+        """Config data, reloaded first if the file changed on disk."""
+        if not self._in_transaction() and self._db_file.stat_key() != self._stat_key:
+            self._data = self._load()
+
+        return self._data
+
+    def _in_transaction(self) -> bool:
+        return getattr(self._local, "depth", 0) > 0
+
+    @contextmanager
+    def transaction(self):
+        """Setters inside the block are written with a single save.
+
+        Nested transactions join the outermost one; an error discards the
+        changes made in memory.
+        """
+        if self._in_transaction():
+            self._local.depth += 1
+            try:
+                yield self
+            finally:
+                self._local.depth -= 1
+            return
+
+        with self._db_file.exclusive_lock():
+            self._fresh()
+            self._local.depth = 1
+            try:
+                yield self
+            except:
+                self._stat_key = None
+                raise
+            finally:
+                self._local.depth = 0
+
+            self._save()
+
+    def _section(self, name: str) -> dict:
+        return self._fresh().setdefault(name, {})
+
+    @property
+    def _base_config(self) -> dict:
+        return self._section("user")
 
     def set_username(self, username):
-        self._base_config["username"] = username
-        self._save()
+        with self.transaction():
+            self._base_config["username"] = username
 
     def get_username(self) -> str:
         return self._base_config["username"]
 
     def get_full_name(self) -> str:
-        return self._data["user"].get("full_name", "")
+        return self._base_config.get("full_name", "")
 
     def set_full_name(self, full_name: str) -> None:
-        self._base_config["full_name"] = full_name
-        self._save()
+        with self.transaction():
+            self._base_config["full_name"] = full_name
 
     def get_password_hash(self) -> str:
         return self._base_config["password_hash"]
 
     def check_password(self, password: str) -> bool:
-        return check_password_hash(self.get_password_hash(), password)
+        """Raises HasherBusy when password hashing is saturated.
+
+        A hash made with outdated parameters is replaced on success.
+        """
+        pwhash = self.get_password_hash()
+        if not password_hasher.check(pwhash, password):
+            return False
+
+        try:
+            if password_hasher.needs_rehash(pwhash):
+                self.set_password(password)
+        except HasherBusy:
+            pass
+
+        return True
 
     def set_password(self, password: str):
-        self._base_config["password_hash"] = generate_password_hash(password)
-        self._save()
+        pwhash = password_hasher.generate(password)
+        with self.transaction():
+            self._base_config["password_hash"] = pwhash
 
     def change_password(self, current_password: str, new_password: str) -> bool:
         if not self.check_password(current_password):
             return False
 
-        self._base_config["password_hash"] = generate_password_hash(new_password)
-        self._save()
-
+        self.set_password(new_password)
         return True
 
     @staticmethod
@@ -105,5 +181,9 @@ class User(flask_login.UserMixin):
     def set_full_name(self, name: str):
         self._config.set_full_name(name)
 
+    def transaction(self):
+        """Groups setters into one write of the user config."""
+        return self._config.transaction()
+
     def get_id(self):
         return self.id
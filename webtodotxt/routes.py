@@ -1,14 +1,30 @@
 from flask import request, render_template, redirect, url_for, jsonify
 from flask_login import login_required
 from functools import wraps
+from flask_limiter.util import get_remote_address
+import hashlib
 from werkzeug import Response
-from .extensions import bp, users_db, login_manager, app, csrf
+from .extensions import bp, users_db, login_manager, app, csrf, limiter
 from .auth import auth_authenticate_post, auth_logout
 from .account import account_post, account_get
 from .main import main_get
 from .token import verify_user_token
-from .crud import crud_form_post, crud_delete, crud_get, crud_put, crud_api_post
+from .crud import (
+    crud_form_post,
+    crud_delete,
+    crud_get,
+    crud_put,
+    crud_api_post,
+    crud_list,
+    crud_batch,
+    crud_api_batch,
+    crud_api_ingest,
+    crud_get_by_id,
+    crud_put_by_id,
+    crud_delete_by_id,
+)
 from .search import search_post, search_get
+from .stats import stats_get
 
 def handle_uncaught_exceptions(f):
     @wraps(f)
@@ -38,7 +54,9 @@ def api_key_required(view_function):
         if x_api_key is None:
             return jsonify({"status": "Unauthorized"}), 401
 
-        if verify_user_token(x_api_key) is None:
+        token = verify_user_token(x_api_key)
+        owner = None if token is None else users_db.get_by_token(token, user.id)
+        if owner is None or owner.id != user.id:
             return jsonify({"status": "Unauthorized"}), 401
 
         return view_function(*args, **kwargs)
@@ -46,6 +64,22 @@ def api_key_required(view_function):
     return wrapper
 
 
+def api_rate_limit_key():
+    """Valid API keys get their own bucket, anything else counts per address."""
+    x_api_key = request.headers.get("X-API-Key")
+    if x_api_key and verify_user_token(x_api_key) is not None:
+        return "token:" + hashlib.sha256(x_api_key.encode()).hexdigest()
+
+    return "addr:" + get_remote_address()
+
+
+api_rate_limit = limiter.shared_limit(
+    lambda: app.config.get("API_RATE_LIMIT", "600 per minute"),
+    scope="api",
+    key_func=api_rate_limit_key,
+)
+
+
 @login_manager.unauthorized_handler
 def handle_needs_login():
     return redirect(url_for("main.index"))
@@ -79,13 +113,56 @@ def internal_crud(line_number):
 
     return redirect(url_for("main.index"))
 
+@bp.route("/task/id/<task_id>", methods=("DELETE", "GET", "PUT"))
+@handle_uncaught_exceptions
+@login_required
+def internal_crud_by_id(task_id):
+    if request.method == "PUT":
+        return crud_put_by_id(task_id)
+    if request.method == "DELETE":
+        return crud_delete_by_id(task_id)
+    if request.method == "GET":
+        return crud_get_by_id(task_id)
+
+    return redirect(url_for("main.index"))
+
+@bp.route("/task/batch", methods=("POST",))
+@handle_uncaught_exceptions
+@login_required
+def internal_batch():
+    return crud_batch()
+
+@bp.route("/tasks", methods=("GET",))
+@handle_uncaught_exceptions
+@login_required
+def internal_list():
+    return crud_list()
+
+
 @bp.route("/api/v1/<username>/task", methods=("POST",))
+@api_rate_limit
 @api_key_required
 @csrf.exempt
 def todo_append_api(username):
     return crud_api_post(username)
 
 
+@bp.route("/api/v1/<username>/tasks", methods=("POST",))
+@api_rate_limit
+@api_key_required
+@csrf.exempt
+def todo_ingest_api(username):
+    return crud_api_ingest(username)
+
+
+@bp.route("/api/v1/<username>/tasks/batch", methods=("POST",))
+@api_rate_limit
+@api_key_required
+@csrf.exempt
+def todo_batch_api(username):
+    return crud_api_batch(username)
+
+
 @bp.route("/logout", methods=("GET", "POST"))
 @handle_uncaught_exceptions
 @login_required
@@ -116,3 +193,10 @@ def search():
         return search_get()
 
     return render_template("404.html")
+
+
+@bp.route("/stats", methods=("GET",))
+@handle_uncaught_exceptions
+@login_required
+def stats():
+    return stats_get()
@@ -1,6 +1,10 @@
 from flask import render_template, redirect, url_for
+from flask_login import current_user
 from flask_wtf import FlaskForm
 from wtforms import StringField, SubmitField
+from .extensions import users_db
+from .models.accounts import AppUser
+from .models.query import QueryError, compile_query
 
 
 class SearchForm(FlaskForm):
@@ -18,8 +22,27 @@ def search_post():
             "search.html", form=form, infos=[("error", "Not validated")]
         )
 
-    query = form.search_box.data
-    return redirect(url_for("main.index", filter=query))
+    query_text = form.search_box.data or ""
+    try:
+        query = compile_query(query_text)
+    except QueryError as e:
+        return render_template("search.html", form=form, infos=[("error", str(e))])
+
+    if not query.words:
+        return redirect(url_for("main.index", filter=query_text))
+
+    requested_user: AppUser | None = users_db.get(current_user.id)
+
+    if requested_user is None:
+        return render_template("error.html", message="User not found.")
+
+    todos = requested_user.get_todos()
+    with todos.lock:
+        results = todos.query_tasks(query, ranked=True)
+
+        return render_template(
+            "search.html", form=form, query=query_text, results=results
+        )
 
 
 def search_get():
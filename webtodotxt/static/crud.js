@@ -1,12 +1,34 @@
 const API_BASE = "/task"; // change to your actual endpoint
 
+// Version of the todo file the page was rendered from, mutations are
+// rejected (412) if the file has changed since.
+let fileVersion = null;
+
+function setFileVersion(version) {
+    fileVersion = version;
+}
+
+function withFileVersion(headers) {
+    if (fileVersion) {
+        headers["If-Match"] = fileVersion;
+    }
+    return headers;
+}
+
+function checkFileVersion(response) {
+    if (response.status === 412) {
+        showErrorDialog("The task list was changed elsewhere, reloading.");
+        throw new Error("Todo file changed");
+    }
+}
+
 function showErrorDialog(message) {
     alert(message);
     location.reload();
 }
 
-async function getLine(csfr, lineNumber) {
-    const response = await fetch(`${API_BASE}/${lineNumber}`, {
+async function getLine(csfr, taskId) {
+    const response = await fetch(`${API_BASE}/id/${taskId}`, {
         method: "GET",
         headers: {
             "Accept": "application/json",
@@ -20,16 +42,17 @@ async function getLine(csfr, lineNumber) {
     return response.json();
 }
 
-async function putLine(csfr, lineNumber, data) {
-    const response = await fetch(`${API_BASE}/${lineNumber}`, {
+async function putLine(csfr, taskId, data) {
+    const response = await fetch(`${API_BASE}/id/${taskId}`, {
         method: "PUT",
-        headers: {
+        headers: withFileVersion({
             "Content-type": "application/json",
             'X-CSRF-TOKEN': csfr
-        },
+        }),
         body: JSON.stringify(data)
     });
 
+    checkFileVersion(response);
     if (!response.ok) {
         showErrorDialog(`PUT failed: ${response.status}`);
         throw new Error(`PUT failed: ${response.status}`);
@@ -38,16 +61,16 @@ async function putLine(csfr, lineNumber, data) {
     return response.json();
 }
 
-async function toggleDone(csfr, lineNumber) {
+async function toggleDone(csfr, taskId) {
     localStorage.setItem("scrollY", window.scrollY);
 
-    await putLine(csfr, lineNumber, { "action": "toggle", "key": "done" });
+    await putLine(csfr, taskId, { "action": "toggle", "key": "done" });
 
     location.reload();
 }
 
-async function openEdit(csfr, lineNumber) {
-    const li = document.getElementById(`task-${lineNumber}`);
+async function openEdit(csfr, taskId) {
+    const li = document.getElementById(`task-${taskId}`);
     if (!li) return;
 
     // Hide existing content
@@ -56,7 +79,7 @@ async function openEdit(csfr, lineNumber) {
     // Fetch current task text
     let taskText = "";
     try {
-        const data = await getLine(csfr, lineNumber);
+        const data = await getLine(csfr, taskId);
         taskText = data.task || "";
     } catch (err) {
         console.error("Failed to fetch task:", err);
@@ -75,7 +98,7 @@ async function openEdit(csfr, lineNumber) {
     // On blur -> save & reload
     textarea.addEventListener("blur", async () => {
         try {
-            await putLine(csfr, lineNumber, { "action": "edit", "key": "line", "value": textarea.value.replace(/\r?\n|\r/g, "") });
+            await putLine(csfr, taskId, { "action": "edit", "key": "line", "value": textarea.value.replace(/\r?\n|\r/g, "") });
             location.reload();
         } catch (err) {
             console.error("Failed to save:", err);
@@ -101,16 +124,17 @@ async function postLine(csfr, lineNumber, data) {
     return response.json();
 }
 
-async function deleteLine(csfr, lineNumber) {
+async function deleteLine(csfr, taskId) {
 
     localStorage.setItem("scrollY", window.scrollY);
 
-    const response = await fetch(`${API_BASE}/${lineNumber}`, {
+    const response = await fetch(`${API_BASE}/id/${taskId}`, {
         method: "DELETE",
-        headers: {
+        headers: withFileVersion({
             'X-CSRF-TOKEN': csfr
-        }
+        })
     });
+    checkFileVersion(response);
     if (!response.ok) {
         showErrorDialog(`DELETE failed: ${response.status}`);
         throw new Error(`DELETE failed: ${response.status}`);
@@ -120,3 +144,142 @@ async function deleteLine(csfr, lineNumber) {
 
     return response.json();
 }
+
+const LIST_URL = "/tasks";
+
+function createSpan(className, text) {
+    const span = document.createElement("span");
+    span.className = className;
+    span.textContent = text;
+    return span;
+}
+
+function createActionLink(text, handler) {
+    const link = document.createElement("a");
+    link.href = "#";
+    link.textContent = text;
+    link.addEventListener("click", (event) => {
+        event.preventDefault();
+        handler();
+    });
+    return link;
+}
+
+function renderTask(csfr, task, currentDate) {
+    const li = document.createElement("li");
+    li.className = task.is_completed ? "task done" : "task";
+    li.id = `task-${task.id}`;
+
+    const checkbox = document.createElement("input");
+    checkbox.className = "do";
+    checkbox.type = "checkbox";
+    checkbox.checked = task.is_completed;
+    checkbox.addEventListener("click", () => toggleDone(csfr, task.id));
+    li.appendChild(checkbox);
+
+    const details = document.createElement("div");
+    details.className = "details";
+
+    const summary = document.createElement("div");
+    summary.className = "summary";
+    summary.appendChild(createSpan("task-linenr", task.line_number));
+    if (task.priority) {
+        summary.appendChild(createSpan("attr-value priority", task.priority));
+    }
+    summary.appendChild(createSpan("task-description", task.description));
+    details.appendChild(summary);
+
+    const attrs = document.createElement("div");
+    attrs.className = "attrs";
+
+    if (task.creation_date) {
+        attrs.appendChild(createSpan("attr-name created", "Created"));
+        attrs.appendChild(createSpan("attr-value created", task.creation_date));
+    }
+    if (task.completion_date) {
+        attrs.appendChild(createSpan("attr-name completion", "Completed"));
+        attrs.appendChild(createSpan("attr-value completion", task.completion_date));
+    }
+    if (task.due_date && !task.is_completed) {
+        const passed = task.due_date <= currentDate ? " passed" : "";
+        attrs.appendChild(createSpan("attr-name due", "Due"));
+        attrs.appendChild(createSpan(`attr-value due${passed}`, task.due_date));
+    }
+    if (task.contexts.length > 0) {
+        attrs.appendChild(createSpan("attr-name context", "Contexts"));
+        task.contexts.forEach(c => attrs.appendChild(createSpan("attr-value context", `@${c}`)));
+    }
+    if (task.projects.length > 0) {
+        attrs.appendChild(createSpan("attr-name project", "Projects"));
+        task.projects.forEach(p => attrs.appendChild(createSpan("attr-value project", `+${p}`)));
+    }
+    Object.entries(task.attributes).forEach(([name, values]) => {
+        attrs.appendChild(createSpan(`attr-name ${name}`, name));
+        values.forEach(v => attrs.appendChild(createSpan(`attr-value ${v}`, v)));
+    });
+    details.appendChild(attrs);
+
+    const actions = document.createElement("div");
+    actions.className = "actions";
+    actions.appendChild(createActionLink("Edit", () => openEdit(csfr, task.id)));
+    actions.appendChild(document.createTextNode(" | "));
+    actions.appendChild(createActionLink("Delete", () => deleteLine(csfr, task.id)));
+    details.appendChild(actions);
+
+    li.appendChild(details);
+    return li;
+}
+
+async function loadNextPage(csfr, list, currentDate, filter) {
+    const params = new URLSearchParams({
+        state: list.dataset.state,
+        after: list.dataset.next,
+        filter: filter,
+    });
+    const response = await fetch(`${LIST_URL}?${params}`, {
+        method: "GET",
+        headers: {
+            "Accept": "application/json",
+            'X-CSRF-TOKEN': csfr
+        }
+    });
+    if (!response.ok) {
+        throw new Error(`GET failed: ${response.status}`);
+    }
+
+    const data = await response.json();
+    data.tasks.forEach(task => list.appendChild(renderTask(csfr, task, currentDate)));
+    list.dataset.next = data.next || "";
+}
+
+function setupLazyList(csfr, listId, currentDate, filter) {
+    const list = document.getElementById(listId);
+    if (!list || !list.dataset.next) return;
+
+    const sentinel = document.createElement("div");
+    sentinel.className = "lazy-sentinel";
+    list.after(sentinel);
+
+    let loading = false;
+    const observer = new IntersectionObserver(async (entries) => {
+        if (loading || !entries.some(entry => entry.isIntersecting)) return;
+
+        loading = true;
+        try {
+            // Keep loading while the end of the list is still on screen.
+            do {
+                await loadNextPage(csfr, list, currentDate, filter);
+            } while (list.dataset.next && sentinel.getBoundingClientRect().top < window.innerHeight);
+        } catch (err) {
+            console.error("Failed to load tasks:", err);
+        } finally {
+            loading = false;
+        }
+
+        if (!list.dataset.next) {
+            observer.disconnect();
+            sentinel.remove();
+        }
+    });
+    observer.observe(sentinel);
+}
@@ -0,0 +1,14 @@
+from flask import jsonify
+from .models.file import lock_metrics
+from .models.password import hash_metrics
+
+
+def stats_get():
+    """Process wide counters of this worker, for spotting contention."""
+    return jsonify(
+        {
+            "status": "OK",
+            "file_locks": lock_metrics.snapshot(),
+            "password_hashing": hash_metrics.snapshot(),
+        }
+    )
@@ -1,11 +1,14 @@
 from itsdangerous import URLSafeSerializer, BadSignature, SignatureExpired
 from flask import current_app
+from functools import lru_cache
+
+@lru_cache(maxsize=4)
+def _serializer_for(secret_key) -> URLSafeSerializer:
+    return URLSafeSerializer(secret_key=secret_key)
 
 def _get_serializer() -> URLSafeSerializer:
-    """Creates a serializer using Flask's SECRET_KEY"""
-    return URLSafeSerializer(
-        secret_key=current_app.config["SECRET_KEY"]
-    )
+    """Serializer for Flask's SECRET_KEY, built once per key."""
+    return _serializer_for(current_app.config["SECRET_KEY"])
 
 def generate_user_token(user_token: str) -> str:
     """Generates a signed token tied to both the Flask secret and user token."""